@@ -6,6 +6,8 @@ from fastapi.templating import Jinja2Templates
 from app.routes import auth, chat, speech_to_text, text_to_speech, text_to_speech_openai, speech_to_text_manual, waiting_list, get_presigned_url
 from app.config import settings
 from app.database import create_tables
+from app.services.metrics import setup_metrics
+from app.services.audio_transcoding import shutdown_transcoding
 import uvicorn
 import logging
 import os
@@ -31,6 +33,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+setup_metrics(app)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -43,6 +46,10 @@ templates = Jinja2Templates(directory="static")
 # async def startup_event():
 #     create_tables()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_transcoding()
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(chat.router)
@@ -4,6 +4,7 @@ from fastapi.responses import JSONResponse
 from PIL import Image
 import pytesseract
 from app.services.auth_utils import get_current_user
+from app.services.metrics import instrument
 from app.schemas.user import UserInToken
 from app.schemas.message import Message
 from pydantic import BaseModel
@@ -101,7 +102,8 @@ async def extract_text_from_image(image: UploadFile = File(...), current_user: U
 
     try:
         img = Image.open(image.file)
-        text = pytesseract.image_to_string(img)
+        with instrument("tesseract", "ocr"):
+            text = pytesseract.image_to_string(img)
         return JSONResponse(content={"text": text})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -117,19 +119,21 @@ async def save_chat_history(conversation: Conversation, current_user: UserInToke
         conversation_dict['userId'] = current_user.user_id
 
         try:
-            existing_data = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+            with instrument("s3", "get_object"):
+                existing_data = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
             existing_conversation = json.loads(existing_data['Body'].read().decode('utf-8'))
             existing_conversation['messages'].extend(conversation_dict['messages'])
             updated_conversation = existing_conversation
         except s3_client.exceptions.NoSuchKey:
             updated_conversation = conversation_dict
 
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=json.dumps(updated_conversation),
-            ContentType='application/json'
-        )
+        with instrument("s3", "put_object"):
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=s3_key,
+                Body=json.dumps(updated_conversation),
+                ContentType='application/json'
+            )
         return {"message": "Chat history saved successfully"}
     except Exception as e:
         logger.error(f"Failed to save chat history: {str(e)}")
@@ -140,10 +144,12 @@ async def get_chat_history(current_user: UserInToken = Depends(get_current_user)
     # Use the user ID from the token directly, no need for a separate request body
     prefix = f"messages/{current_user.user_id}/"
     try:
-        objects = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
+        with instrument("s3", "list_objects"):
+            objects = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
         chat_history = []
         for obj in objects.get('Contents', []):
-            file_data = s3_client.get_object(Bucket=bucket_name, Key=obj['Key'])
+            with instrument("s3", "get_object"):
+                file_data = s3_client.get_object(Bucket=bucket_name, Key=obj['Key'])
             conversation = json.loads(file_data['Body'].read().decode('utf-8'))
             chat_history.append(conversation)
         return chat_history
@@ -172,7 +178,8 @@ async def upload_image(image: UploadFile = File(...), image_id: str = Form(...))
         file_extension = os.path.splitext(image.filename)[1]
         s3_key = f"images/{image_id}{file_extension}"
 
-        s3_client.upload_fileobj(image.file, bucket_name, s3_key)
+        with instrument("s3", "upload"):
+            s3_client.upload_fileobj(image.file, bucket_name, s3_key)
 
         return JSONResponse(content={"message": "Image uploaded successfully", "image_id": image_id}, status_code=200)
     except ClientError as e:
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import boto3
+from app.services.metrics import instrument
 import logging
 from dotenv import load_dotenv
 
@@ -25,7 +26,8 @@ async def get_audio_urls(request: UrlRequest):
     try:
         # List objects in the S3 bucket with the given prefix
         prefix = f"{request.type}/{request.user_id}/{request.message_id}"
-        response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
+        with instrument("s3", "list_objects"):
+            response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
 
         # Generate presigned URLs for each object
         audio_urls = []
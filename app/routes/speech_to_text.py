@@ -1,11 +1,11 @@
 import logging
 import asyncio
 import os
-from queue import Queue
+from typing import Optional
 from dotenv import load_dotenv
-from threading import Thread
 from fastapi import APIRouter, WebSocket, HTTPException
 from starlette.websockets import WebSocketState, WebSocketDisconnect
+from app.services.metrics import instrument
 from deepgram import (
     DeepgramClient,
     DeepgramClientOptions,
@@ -20,40 +20,98 @@ router = APIRouter()
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-message_queue = Queue()
-# Global variables for collecting final transcriptions
-is_finals = []
+# Transcripts waiting to be sent to one client; beyond that interim results are dropped
+TRANSCRIPT_QUEUE_SIZE = int(os.getenv("TRANSCRIPT_QUEUE_SIZE", "64"))
+# Deepgram endpoint, e.g. a local stub server for load tests; empty for the Deepgram API
+DEEPGRAM_URL = os.getenv("DEEPGRAM_URL", "")
 
-def process_messages(websocket):
-    while True:
-        message = message_queue.get()
-        if message is None:
-            break
-        asyncio.run(websocket.send_json(message))
 
-async def on_open(self, open, **kwargs):
-    logger.info("Deepgram Connection Open")
+class TranscriptionBridge:
+    """
+    Relay of the Deepgram transcripts of one websocket connection.
 
-async def on_message(self, result):
-    try:
-        sentence = result.channel.alternatives[0].transcript
-        logger.info(f"Received transcription: {sentence}")
-        if len(sentence) == 0:
+    Every connection has its own bounded queue, drained by a sender task
+    on the event loop. When the client does not keep up, interim results
+    are dropped and final results wait for room in the queue, which slows
+    down reading from Deepgram instead of growing memory. Once the client
+    is gone every result is dropped, so Deepgram is never blocked.
+    """
+
+    def __init__(self, websocket: WebSocket) -> None:
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=TRANSCRIPT_QUEUE_SIZE)
+        self.is_finals = []
+        self.dropped = 0
+        self.sender: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.sender = asyncio.create_task(self.send_messages())
+
+    async def send_messages(self) -> None:
+        while True:
+            message = await self.queue.get()
+            try:
+                await self.websocket.send_json(message)
+            except (WebSocketDisconnect, RuntimeError):
+                logger.info("WebSocket closed, stopping transcript sender")
+                return
+
+    async def stop(self) -> None:
+        if self.sender is not None:
+            self.sender.cancel()
+            await asyncio.gather(self.sender, return_exceptions=True)
+        if self.dropped:
+            logger.info(f"Dropped {self.dropped} interim results for a slow client")
+
+    async def put_final(self, message: dict) -> None:
+        """Queue a final result, waiting for room only while the sender is still running."""
+        if self.sender is None or self.sender.done():
             return
+        try:
+            self.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        put = asyncio.ensure_future(self.queue.put(message))
+        await asyncio.wait({put, self.sender}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            # The socket closed while waiting, nothing will read the queue anymore
+            put.cancel()
+
+    async def on_message(self, connection, result, **kwargs):
+        try:
+            sentence = result.channel.alternatives[0].transcript
+            if len(sentence) == 0:
+                return
+
+            message = {
+                "type": "transcription",
+                "text": sentence,
+                "is_final": result.is_final,
+                "speech_final": result.speech_final,
+            }
+            if result.is_final:
+                logger.info(f"Final transcription: {sentence}")
+                self.is_finals.append(sentence)
+                await self.put_final(message)
+            else:
+                try:
+                    self.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    self.dropped += 1
+        except Exception as e:
+            logger.error(f"Error in on_message: {str(e)}")
+
+    async def on_utterance_end(self, connection, utterance_end, **kwargs):
+        logger.info("Utterance End")
+        if len(self.is_finals) > 0:
+            utterance = " ".join(self.is_finals)
+            logger.info(f"Utterance End: {utterance}")
+            self.is_finals = []
 
-        message_queue.put({
-            "type": "transcription",
-            "text": sentence,
-            "is_final": result.is_final,
-            "speech_final": result.speech_final,
-        })
-
-        if result.is_final:
-            logger.info(f"Final transcription: {sentence}")
-        else:
-            logger.info(f"Interim Results: {sentence}")
-    except Exception as e:
-        logger.error(f"Error in on_message: {str(e)}")
+
+async def on_open(self, open, **kwargs):
+    logger.info("Deepgram Connection Open")
 
 async def on_metadata(self, metadata, **kwargs):
     logger.info(f"Metadata: {metadata}")
@@ -61,14 +119,6 @@ async def on_metadata(self, metadata, **kwargs):
 async def on_speech_started(self, speech_started, **kwargs):
     logger.info("Speech Started")
 
-async def on_utterance_end(self, utterance_end, **kwargs):
-    global is_finals
-    logger.info("Utterance End")
-    if len(is_finals) > 0:
-        utterance = " ".join(is_finals)
-        logger.info(f"Utterance End: {utterance}")
-        is_finals = []
-
 async def on_close(self, close, **kwargs):
     logger.info("Deepgram Connection Closed")
 
@@ -80,11 +130,16 @@ async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("WebSocket connection accepted")
 
-    config = DeepgramClientOptions(options={"keepalive": "true"})
+    if DEEPGRAM_URL:
+        config = DeepgramClientOptions(url=DEEPGRAM_URL, options={"keepalive": "true"})
+    else:
+        config = DeepgramClientOptions(options={"keepalive": "true"})
     deepgram = DeepgramClient(os.getenv("DEEPGRAM_API_KEY"), config)
     dg_connection = deepgram.listen.asyncwebsocket.v("1")
 
-    dg_connection.on(LiveTranscriptionEvents.Transcript, on_message)
+    bridge = TranscriptionBridge(websocket)
+    dg_connection.on(LiveTranscriptionEvents.Transcript, bridge.on_message)
+    dg_connection.on(LiveTranscriptionEvents.UtteranceEnd, bridge.on_utterance_end)
 
     options = LiveOptions(
         model="nova-2",
@@ -101,14 +156,14 @@ async def websocket_endpoint(websocket: WebSocket):
     )
 
     addons = {"no_delay": "true"}
-    message_thread = Thread(target=process_messages, args=(websocket,))
-    message_thread.start()
+    bridge.start()
 
     try:
         logger.info("Starting Deepgram connection...")
-        if await dg_connection.start(options, addons=addons) is False:
+        with instrument("deepgram", "connect"):
+            started = await dg_connection.start(options, addons=addons)
+        if started is False:
             logger.error("Failed to connect to Deepgram")
-            await websocket.close()
             return
 
         logger.info("Deepgram connection started successfully")
@@ -116,22 +171,24 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
                     try:
                         data = await websocket.receive_bytes()
-                        logger.debug(f"Received audio data, size: {len(data)} bytes")
                         await dg_connection.send(data)
-                        logger.debug("Sent audio data to Deepgram")
                     except WebSocketDisconnect:
                         logger.info("WebSocket disconnected")
                         break
                     except Exception as e:
                         logger.error(f"Error processing audio data: {str(e)}")
+                        if websocket.client_state != WebSocketState.CONNECTED:
+                            break
 
+    except asyncio.CancelledError:
+        logger.info("WebSocket handler cancelled")
+        raise
     except Exception as e:
         logger.error(f"WebSocket Error: {str(e)}")
     finally:
         logger.info("Closing Deepgram connection...")
         await dg_connection.finish()
-        message_queue.put(None)  # Signal the message processing thread to stop
-        message_thread.join()
+        await bridge.stop()
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.close()
         logger.info("WebSocket connection closed")
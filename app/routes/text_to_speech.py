@@ -1,11 +1,14 @@
 import os
 from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import  StreamingResponse
-import requests
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import logging
-import io
 import boto3
+from app.services.client_registry import client_registry
+from app.services.metrics import instrument
+from app.services.s3_stream_upload import S3StreamUpload
+from app.services.tts_cache import tts_cache
 
 
 router = APIRouter()
@@ -22,16 +25,8 @@ class TextToSpeechRequest(BaseModel):
 s3_client = boto3.client('s3')
 bucket_name = 'toruchat'
 
-# Function to upload audio to S3 in the background
-def upload_audio_to_s3(audio_bytes: bytes, s3_key: str):
-    try:
-        s3_client.upload_fileobj(io.BytesIO(audio_bytes), bucket_name, s3_key)
-        print(f"File uploaded successfully to s3://{bucket_name}/{s3_key}")
-    except Exception as e:
-        print(f"Error uploading file to S3: {e}")
-
 @router.post("/api/synthesize_audio")
-async def synthesize_audio_endpoint(request: TextToSpeechRequest, background_tasks: BackgroundTasks):
+async def synthesize_audio_endpoint(request: TextToSpeechRequest):
     try:
         headers = {
             "xi-api-key": os.getenv("ELEVEN_API_KEY"),
@@ -49,24 +44,53 @@ async def synthesize_audio_endpoint(request: TextToSpeechRequest, background_tas
         }
 
         voice_id = os.getenv("ELEVEN_VOICE_ID")
+        s3_key = f"audio/{request.user_id}/{request.message_id}.mp3"
 
-        response = requests.post(
+        # Repeated phrases and replays are served from the cache, with range requests
+        cache_key = tts_cache.key("elevenlabs", voice_id, payload["model_id"], payload["voice_settings"], request.text)
+        cached_path = await tts_cache.get(cache_key)
+        if cached_path is not None:
+            tts_cache.copy_to(cache_key, bucket_name, s3_key)
+            return FileResponse(cached_path, media_type="audio/mpeg")
+
+        http_client = client_registry.async_http_client()
+        upstream_request = http_client.build_request(
+            "POST",
             f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream",
             json=payload,
-            headers=headers,
-            stream=True
+            headers=headers
         )
+        # Measures the time to the response headers, the audio is read while it is sent
+        with instrument("elevenlabs", "tts"):
+            response = await http_client.send(upstream_request, stream=True)
 
         if response.status_code != 200:
-            logger.error(f"Eleven Labs API error: {response.text}")
+            error = await response.aread()
+            await response.aclose()
+            logger.error(f"Eleven Labs API error: {error.decode(errors='replace')}")
             raise HTTPException(status_code=response.status_code, detail="Error from Eleven Labs API")
 
-        # Add a background task to upload the audio to S3
-        s3_key = f"audio/{request.user_id}/{request.message_id}.mp3"
-        background_tasks.add_task(upload_audio_to_s3, response.content, s3_key)
+        async def stream_audio():
+            # The chunks sent to the browser are uploaded to S3 at the same time
+            upload = S3StreamUpload(s3_client, bucket_name, s3_key)
+            chunks = []
+            try:
+                async for chunk in response.aiter_bytes():
+                    upload.write(chunk)
+                    chunks.append(chunk)
+                    yield chunk
+            except BaseException:
+                # ElevenLabs failed or the browser went away, the audio is incomplete
+                upload.abort()
+                raise
+            else:
+                upload.close()
+                await tts_cache.put(cache_key, b"".join(chunks))
+            finally:
+                await response.aclose()
 
-        # Return the audio as a streaming response
-        return StreamingResponse(io.BytesIO(response.content), media_type="audio/mpeg")
+        # Also closes the ElevenLabs response when the browser leaves before the stream starts
+        return StreamingResponse(stream_audio(), media_type="audio/mpeg", background=BackgroundTask(response.aclose))
 
     except Exception as error:
         logger.error(f"Error in synthesize_audio_endpoint: {str(error)}")
@@ -2,12 +2,15 @@ import os
 from openai import OpenAI
 from pydantic import BaseModel
 from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import logging
 import io
 from dotenv import load_dotenv
 import boto3
 from botocore.exceptions import NoCredentialsError
+from app.services.client_registry import client_registry
+from app.services.metrics import instrument
+from app.services.tts_cache import tts_cache
 
 # Load environment variables
 load_dotenv("/etc/secrets/.env")
@@ -23,14 +26,15 @@ class TextToSpeechRequest(BaseModel):
     user_id: str
     message_id: str
 
-client = OpenAI()
+client = client_registry.openai()
 s3_client = boto3.client('s3')
 bucket_name = 'toruchat'
 
 # Function to upload audio to S3 in the background
 def upload_audio_to_s3(audio_bytes: bytes, s3_key: str):
     try:
-        s3_client.upload_fileobj(io.BytesIO(audio_bytes), bucket_name, s3_key)
+        with instrument("s3", "upload"):
+            s3_client.upload_fileobj(io.BytesIO(audio_bytes), bucket_name, s3_key)
         print(f"File uploaded successfully to s3://{bucket_name}/{s3_key}")
     except Exception as e:
         print(f"Error uploading file to S3: {e}")
@@ -38,15 +42,26 @@ def upload_audio_to_s3(audio_bytes: bytes, s3_key: str):
 @router.post("/api/synthesize_audio_openai")
 async def synthesize_audio_openai_endpoint(request: TextToSpeechRequest, background_tasks: BackgroundTasks):
     try:
+        s3_key = f"audio/{request.user_id}/{request.message_id}.mp3"
+
+        # Repeated phrases and replays are served from the cache, with range requests
+        cache_key = tts_cache.key("openai", "nova", "tts-1", {}, request.text)
+        cached_path = await tts_cache.get(cache_key)
+        if cached_path is not None:
+            tts_cache.copy_to(cache_key, bucket_name, s3_key)
+            return FileResponse(cached_path, media_type="audio/mpeg")
+
         # Call OpenAI API for text-to-speech synthesis
-        response = client.audio.speech.create(
-            model="tts-1",
-            voice="nova",
-            input=request.text
-        )
+        with instrument("openai", "tts"):
+            response = client.audio.speech.create(
+                model="tts-1",
+                voice="nova",
+                input=request.text
+            )
+
+        await tts_cache.put(cache_key, response.content)
 
         # Add a background task to upload the audio to S3
-        s3_key = f"audio/{request.user_id}/{request.message_id}.mp3"
         background_tasks.add_task(upload_audio_to_s3, response.content, s3_key)
 
         # Return the audio as a streaming response
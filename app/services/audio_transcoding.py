@@ -0,0 +1,113 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from pydub import AudioSegment
+from pydub.silence import detect_silence
+
+from app.services.metrics import instrument
+
+# Whisper resamples to 16 kHz mono anyway, sending it more only grows the upload
+TRANSCODE_SAMPLE_RATE = int(os.getenv("TRANSCODE_SAMPLE_RATE", "16000"))
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Longest piece of a recording sent to Whisper in one request
+CHUNK_MAX_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", "30"))
+SILENCE_MIN_MS = 400
+# Silence is quieter than the recording average by this many dB
+SILENCE_RELATIVE_DB = 16
+
+
+class AudioDecodeError(Exception):
+    """Raised when the uploaded audio cannot be decoded."""
+
+
+def _decode(audio_bytes: bytes, file_format: Optional[str], sample_rate: int) -> AudioSegment:
+    try:
+        audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format=file_format)
+    except Exception as e:
+        raise AudioDecodeError(str(e))
+    return audio.set_channels(1).set_frame_rate(sample_rate).set_sample_width(2)
+
+
+def _cut_points(audio: AudioSegment, max_chunk_ms: int) -> List[int]:
+    """Positions where to cut `audio` so no piece exceeds `max_chunk_ms`, in the middle of silences when possible."""
+    if len(audio) <= max_chunk_ms:
+        return []
+    silences = detect_silence(audio, min_silence_len=SILENCE_MIN_MS, silence_thresh=audio.dBFS - SILENCE_RELATIVE_DB, seek_step=10)
+    pauses = [(start + end) // 2 for start, end in silences]
+    cuts = []
+    start = 0
+    while len(audio) - start > max_chunk_ms:
+        limit = start + max_chunk_ms
+        # Pieces shorter than a third of the limit would only add requests
+        candidates = [pause for pause in pauses if start + max_chunk_ms // 3 < pause <= limit]
+        start = candidates[-1] if candidates else limit
+        cuts.append(start)
+    return cuts
+
+
+def to_speech_chunks(
+    audio_bytes: bytes,
+    file_format: Optional[str] = None,
+    max_chunk_seconds: float = CHUNK_MAX_SECONDS,
+    sample_rate: int = TRANSCODE_SAMPLE_RATE,
+) -> List[bytes]:
+    """
+    Convert an uploaded recording to 16-bit mono WAV at `sample_rate`, in
+    memory, and split it on silences into pieces of at most
+    `max_chunk_seconds`, in order.
+
+    ffmpeg reads the recording from a pipe and the pieces are written to
+    buffers, no temporary file is created. A recording shorter than the
+    limit gives a single piece.
+
+    :param audio_bytes: The uploaded file.
+    :param file_format: Container of the file, e.g. "webm"; None lets ffmpeg probe it.
+    """
+    audio = _decode(audio_bytes, file_format, sample_rate)
+    bounds = [0] + _cut_points(audio, int(max_chunk_seconds * 1000)) + [len(audio)]
+    chunks = []
+    for start, end in zip(bounds, bounds[1:]):
+        buffer = io.BytesIO()
+        audio[start:end].export(buffer, format="wav")
+        chunks.append(buffer.getvalue())
+    return chunks
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # The servers run threads, forking them is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=TRANSCODE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+async def transcode_for_speech_chunks(audio_bytes: bytes, file_format: Optional[str] = None) -> List[bytes]:
+    """
+    Run `to_speech_chunks` in the transcoding process pool, off the event loop.
+
+    :raises AudioDecodeError: If the recording cannot be decoded.
+    """
+    loop = asyncio.get_running_loop()
+    with instrument("ffmpeg", "transcode"):
+        return await loop.run_in_executor(get_executor(), to_speech_chunks, audio_bytes, file_format)
+
+
+def shutdown_transcoding() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
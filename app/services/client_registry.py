@@ -0,0 +1,144 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from app.services.metrics import InstrumentedEmbeddings, LLMMetricsCallback, register_stats
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "600"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+
+
+def _settings_key(name: str, settings: Dict[str, Any]) -> Tuple:
+    return (name,) + tuple(sorted(settings.items()))
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of HTTP and OpenAI clients.
+
+    Every client is created once per set of settings and shares one
+    keep-alive httpx connection pool (one sync, one async), so TLS
+    connections to OpenAI and the other providers are reused across
+    requests and across the classes using them.
+    """
+
+    def __init__(self) -> None:
+        self._clients: Dict[Tuple, Any] = {}
+        self._created: Dict[str, int] = {}
+        self._reused: Dict[str, int] = {}
+        # Re-entrant: building a client gets the shared pool from the registry
+        self._lock = threading.RLock()
+
+    def _get(self, key: Tuple, build: Callable[[], Any]) -> Any:
+        name = key[0]
+        with self._lock:
+            if key in self._clients:
+                self._reused[name] = self._reused.get(name, 0) + 1
+            else:
+                self._clients[key] = build()
+                self._created[name] = self._created.get(name, 0) + 1
+            return self._clients[key]
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    @staticmethod
+    def _timeout() -> httpx.Timeout:
+        return httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+    def http_client(self) -> httpx.Client:
+        return self._get(("http", ), lambda: httpx.Client(limits=self._limits(), timeout=self._timeout()))
+
+    def async_http_client(self) -> httpx.AsyncClient:
+        return self._get(("async_http", ), lambda: httpx.AsyncClient(limits=self._limits(), timeout=self._timeout()))
+
+    def openai(self, **settings: Any) -> OpenAI:
+        """
+        Return the shared OpenAI client for `settings` (keyword arguments of OpenAI()).
+        """
+        return self._get(
+            _settings_key("openai", settings),
+            lambda: OpenAI(http_client=self.http_client(), **settings)
+        )
+
+    def async_openai(self, **settings: Any) -> AsyncOpenAI:
+        """
+        Return the shared AsyncOpenAI client for `settings` (keyword arguments of AsyncOpenAI()).
+        """
+        return self._get(
+            _settings_key("async_openai", settings),
+            lambda: AsyncOpenAI(http_client=self.async_http_client(), **settings)
+        )
+
+    def chat_model(self, model: str, **settings: Any):
+        """
+        Return the shared ChatOpenAI model for `model` and `settings`.
+
+        :param model: Name of the OpenAI model.
+        :param settings: Other keyword arguments of ChatOpenAI, e.g. temperature.
+        """
+        from langchain_openai import ChatOpenAI
+
+        return self._get(
+            _settings_key("chat_model", dict(settings, model=model)),
+            lambda: ChatOpenAI(
+                model=model,
+                http_client=self.http_client(),
+                http_async_client=self.async_http_client(),
+                callbacks=[LLMMetricsCallback(model)],
+                **settings
+            )
+        )
+
+    def embeddings(self, model: str, **settings: Any) -> InstrumentedEmbeddings:
+        """
+        Return the shared, instrumented OpenAIEmbeddings for `model` and `settings`.
+
+        :param model: Name of the OpenAI embedding model.
+        :param settings: Other keyword arguments of OpenAIEmbeddings.
+        """
+        from langchain_openai import OpenAIEmbeddings
+
+        return self._get(
+            _settings_key("embeddings", dict(settings, model=model)),
+            lambda: InstrumentedEmbeddings(OpenAIEmbeddings(
+                model=model,
+                http_client=self.http_client(),
+                http_async_client=self.async_http_client(),
+                **settings
+            ))
+        )
+
+    @staticmethod
+    def _pool_stats(client: Any) -> Dict[str, int]:
+        # httpx does not expose its pool publicly, read it defensively
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"connections": len(connections), "idle_connections": idle, "active_connections": len(connections) - idle}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the number of clients created and reused, and the state of the connection pools.
+        """
+        with self._lock:
+            stats: Dict[str, Any] = {"created": dict(self._created), "reused": dict(self._reused)}
+            pools = {name[0]: client for name, client in self._clients.items() if name[0] in ("http", "async_http")}
+        for name, client in pools.items():
+            stats[f"{name}_pool"] = self._pool_stats(client)
+        return stats
+
+
+client_registry = ClientRegistry()
+register_stats("client_registry", client_registry.stats)
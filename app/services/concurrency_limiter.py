@@ -0,0 +1,50 @@
+import asyncio
+from typing import Dict
+
+
+class QueueFullError(Exception):
+    """Raised when a limiter already has `max_queue` callers waiting."""
+
+
+class ConcurrencyLimiter:
+    """
+    Async limit on the number of concurrent calls, with a bounded wait queue.
+
+    At most `max_concurrency` callers are inside the limiter; up to
+    `max_queue` more wait for a slot, and callers beyond that are rejected
+    right away with QueueFullError so the service can answer 503 instead of
+    piling up requests.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int) -> None:
+        """
+        :param name: Name of the limited call, used in errors and stats.
+        :param max_concurrency: Maximum number of concurrent calls.
+        :param max_queue: Maximum number of callers waiting for a slot.
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self) -> "ConcurrencyLimiter":
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"Too many {self.name} requests waiting")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"active": self.active, "waiting": self.waiting, "rejected": self.rejected}
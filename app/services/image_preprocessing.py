@@ -0,0 +1,62 @@
+import hashlib
+import io
+import os
+from typing import NamedTuple
+
+from PIL import Image, ImageOps
+
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1568"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+
+class UnsupportedImageError(ValueError):
+    """Raised when the uploaded file is not an image PIL can read."""
+
+
+class PreparedImage(NamedTuple):
+    data: bytes
+    media_type: str
+    sha256: str
+
+
+def prepare_image(image_bytes: bytes, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_JPEG_QUALITY) -> PreparedImage:
+    """
+    Normalize an uploaded image before sending it to a vision model.
+
+    The image is rotated according to its EXIF orientation, downscaled so
+    its longest side is at most `max_side` and re-encoded as JPEG at
+    `quality`. The original bytes are kept when they are already an upright
+    JPEG within the size limit and smaller than the re-encoded image.
+
+    :param image_bytes: The uploaded file.
+    :return: The bytes to send, their media type and their sha256, which identifies duplicates.
+    :raises UnsupportedImageError: If PIL cannot read the file, the vision models would reject it too.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        original_format = image.format
+        rotated = image.getexif().get(0x0112, 1) != 1
+        image = ImageOps.exif_transpose(image)
+    except Exception as e:
+        print(f"Error in prepare_image: {str(e)}")
+        raise UnsupportedImageError(f"Unsupported image: {str(e)}")
+
+    resized = max(image.size) > max_side
+    if resized:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if image.mode in ("RGBA", "LA", "P"):
+        # JPEG has no transparency, drawings on a transparent background are put on white
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    data = buffer.getvalue()
+    if original_format == "JPEG" and not resized and not rotated and len(image_bytes) <= len(data):
+        data = image_bytes
+
+    return PreparedImage(data, "image/jpeg", hashlib.sha256(data).hexdigest())
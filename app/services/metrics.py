@@ -0,0 +1,303 @@
+import functools
+import inspect
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+
+from fastapi import FastAPI, Request, Response
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+EXTERNAL_CALL_LATENCY = Histogram(
+    "toru_external_call_seconds",
+    "Latency of outbound calls",
+    ["service", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    "toru_external_call_errors_total",
+    "Outbound calls that raised an error",
+    ["service", "operation"],
+)
+EXTERNAL_CALLS_IN_FLIGHT = Gauge(
+    "toru_external_calls_in_flight",
+    "Outbound calls in progress",
+    ["service", "operation"],
+    multiprocess_mode="livesum",
+)
+LLM_TOKENS = Counter(
+    "toru_llm_tokens_total",
+    "Tokens consumed by the LLM calls",
+    ["model", "kind"],
+)
+GENERATION_TIME_TO_FIRST_TOKEN = Histogram(
+    "toru_generation_time_to_first_token_seconds",
+    "Time from the start of a streamed generation to its first token",
+    ["name"],
+    buckets=LATENCY_BUCKETS,
+)
+GENERATION_TOKENS_PER_SECOND = Histogram(
+    "toru_generation_tokens_per_second",
+    "Output throughput of a streamed generation after its first token",
+    ["name"],
+    buckets=(1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 300),
+)
+PIPELINE_STAGE_LATENCY = Histogram(
+    "toru_pipeline_stage_seconds",
+    "Duration of the stages of the prompt pipelines, \"total\" for a whole run",
+    ["pipeline", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_LATENCY = Histogram(
+    "toru_http_request_seconds",
+    "Latency of the requests served, until the response headers are sent",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class instrument:
+    """
+    Record the latency, errors and concurrency of an outbound call.
+
+    Usable as a context manager (sync or async)::
+
+        with instrument("chroma", "query"):
+            ...
+
+    or as a decorator of a sync or async function::
+
+        @instrument("wolfram", "query")
+        async def run_wolfram(...):
+            ...
+    """
+
+    def __init__(self, service: str, operation: str) -> None:
+        """
+        :param service: The called service, e.g. "openai", "chroma", "wolfram".
+        :param operation: The operation on the service, e.g. "embeddings".
+        """
+        self.service = service
+        self.operation = operation
+        self._started_at: Optional[float] = None
+
+    def __enter__(self) -> "instrument":
+        EXTERNAL_CALLS_IN_FLIGHT.labels(self.service, self.operation).inc()
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        EXTERNAL_CALL_LATENCY.labels(self.service, self.operation).observe(time.perf_counter() - self._started_at)
+        EXTERNAL_CALLS_IN_FLIGHT.labels(self.service, self.operation).dec()
+        if exc_type is not None:
+            EXTERNAL_CALL_ERRORS.labels(self.service, self.operation).inc()
+
+    async def __aenter__(self) -> "instrument":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        self.__exit__(exc_type, exc, traceback)
+
+    def __call__(self, fn: Callable) -> Callable:
+        # Every call gets its own instance, so concurrent calls do not share a start time
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                async with instrument(self.service, self.operation):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with instrument(self.service, self.operation):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def record_tokens(model: str, usage: Optional[Dict[str, Any]]) -> None:
+    """
+    Count the tokens of an LLM call.
+
+    :param model: Name of the model.
+    :param usage: Usage reported by the provider, either LangChain usage_metadata
+        (input_tokens/output_tokens) or OpenAI usage (prompt_tokens/completion_tokens).
+    """
+    if not usage:
+        return
+    input_tokens = usage.get("input_tokens", usage.get("prompt_tokens"))
+    output_tokens = usage.get("output_tokens", usage.get("completion_tokens"))
+    if input_tokens:
+        LLM_TOKENS.labels(model, "input").inc(input_tokens)
+    if output_tokens:
+        LLM_TOKENS.labels(model, "output").inc(output_tokens)
+
+
+def record_generation(name: str, time_to_first_token: Optional[float], tokens_per_second: Optional[float]) -> None:
+    """
+    Record the latency and throughput of a streamed generation.
+
+    :param name: Name of the generation, e.g. "math_chat".
+    :param time_to_first_token: Seconds until the first token, None if nothing was generated.
+    :param tokens_per_second: Output throughput, None if it could not be measured.
+    """
+    if time_to_first_token is not None:
+        GENERATION_TIME_TO_FIRST_TOKEN.labels(name).observe(time_to_first_token)
+    if tokens_per_second is not None:
+        GENERATION_TOKENS_PER_SECOND.labels(name).observe(tokens_per_second)
+
+
+def record_stage(pipeline: str, stage: str, seconds: float) -> None:
+    """
+    Record the duration of a pipeline stage.
+
+    :param pipeline: Name of the pipeline, e.g. "exercice_prompt".
+    :param stage: Name of the stage, "total" for the whole run.
+    """
+    PIPELINE_STAGE_LATENCY.labels(pipeline, stage).observe(seconds)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    LangChain callback instrumenting every call of a chat model: invoke,
+    stream and structured output alike.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self._calls: Dict[UUID, instrument] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs) -> None:
+        call = instrument("openai", f"chat:{self.model}")
+        call.__enter__()
+        self._calls[run_id] = call
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs) -> None:
+        call = self._calls.pop(run_id, None)
+        if call is not None:
+            call.__exit__(None, None, None)
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                record_tokens(self.model, getattr(message, "usage_metadata", None))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        call = self._calls.pop(run_id, None)
+        if call is not None:
+            call.__exit__(type(error), error, None)
+
+
+class InstrumentedEmbeddings(Embeddings):
+    """LangChain embeddings recording every call as an outbound call to `service`."""
+
+    def __init__(self, embeddings: Embeddings, service: str = "openai", operation: str = "embeddings") -> None:
+        """
+        :param embeddings: The wrapped embeddings, e.g. an OpenAIEmbeddings.
+        """
+        self.embeddings = embeddings
+        self.service = service
+        self.operation = operation
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with instrument(self.service, self.operation):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with instrument(self.service, self.operation):
+            return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        async with instrument(self.service, self.operation):
+            return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        async with instrument(self.service, self.operation):
+            return await self.embeddings.aembed_query(text)
+
+
+_stats_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_stats(name: str, stats: Callable[[], Dict[str, Any]]) -> None:
+    """
+    Expose the numeric values returned by `stats` (e.g. the stats() of a cache
+    or of the client registry) as gauges named toru_<name>_<key>.
+    """
+    _stats_sources[name] = stats
+
+
+def _flatten(stats: Dict[str, Any], prefix: str = ""):
+    for key, value in stats.items():
+        name = f"{prefix}_{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+class _StatsCollector:
+    def collect(self):
+        for source, stats in list(_stats_sources.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Error collecting {source} stats: {str(e)}")
+                continue
+            for key, value in _flatten(values):
+                metric = "".join(char if char.isalnum() else "_" for char in f"toru_{source}_{key}")
+                gauge = GaugeMetricFamily(metric, f"{key} of {source}")
+                gauge.add_metric([], value)
+                yield gauge
+
+
+REGISTRY.register(_StatsCollector())
+
+
+def render_metrics() -> bytes:
+    # With several workers, prometheus_client aggregates the values written in PROMETHEUS_MULTIPROC_DIR
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_StatsCollector())
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def setup_metrics(app: FastAPI) -> None:
+    """
+    Record the latency of every request served by `app` and expose all metrics on GET /metrics.
+    """
+
+    @app.middleware("http")
+    async def record_request_latency(request: Request, call_next):
+        started_at = time.perf_counter()
+        status = "500"
+        try:
+            response = await call_next(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            route = request.scope.get("route")
+            HTTP_REQUEST_LATENCY.labels(
+                request.method,
+                getattr(route, "path", "unmatched"),
+                status
+            ).observe(time.perf_counter() - started_at)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics() -> Response:
+        return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
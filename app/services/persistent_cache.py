@@ -0,0 +1,180 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class PersistentCache:
+    """
+    Two-tier key/value cache: an in-memory LRU in front of a SQLite file.
+
+    The SQLite tier survives restarts and can be shared by several worker
+    processes on the same host. Values are serialized with `dumps`/`loads`
+    (JSON by default) and can optionally expire after `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        table: str = "cache",
+        max_memory_items: int = 1024,
+        ttl: Optional[float] = None,
+        dumps: Callable[[Any], bytes] = lambda value: json.dumps(value).encode("utf-8"),
+        loads: Callable[[bytes], Any] = lambda raw: json.loads(raw.decode("utf-8")),
+    ) -> None:
+        """
+        :param path: Path of the SQLite file backing the cache.
+        :param table: Table name, so several caches can share one file.
+        :param max_memory_items: Size of the in-memory LRU front.
+        :param ttl: Time to live in seconds, None to never expire.
+        :param dumps: Function serializing a value to bytes.
+        :param loads: Function deserializing bytes to a value.
+        """
+        self.path = path
+        self.table = table
+        self.max_memory_items = max_memory_items
+        self.ttl = ttl
+        self.dumps = dumps
+        self.loads = loads
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+        )
+        self._conn.commit()
+
+    def _remember(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Look up several keys at once.
+
+        :param keys: Keys to look up.
+        :return: Dictionary containing only the keys that were found.
+        """
+        now = time.time()
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Any] = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    self._memory.move_to_end(key)
+                    found[key] = entry[0]
+                else:
+                    missing.append(key)
+
+            if missing:
+                placeholders = ",".join("?" for _ in missing)
+                rows = self._conn.execute(
+                    f"SELECT key, value, expires_at FROM {self.table} WHERE key IN ({placeholders})",
+                    missing
+                ).fetchall()
+                for key, raw, expires_at in rows:
+                    if expires_at is not None and expires_at <= now:
+                        continue
+                    value = self.loads(raw)
+                    self._remember(key, value, expires_at)
+                    found[key] = value
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else None
+        rows = [(key, self.dumps(value), expires_at) for key, value in items.items()]
+        with self._lock:
+            for key, value in items.items():
+                self._remember(key, value, expires_at)
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def items(self) -> Dict[str, Any]:
+        """
+        Return every entry of the SQLite tier that has not expired.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE expires_at IS NULL OR expires_at > ?",
+                (time.time(),)
+            ).fetchall()
+        return {key: self.loads(raw) for key, raw in rows}
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def trim(self, max_items: int) -> int:
+        """
+        Remove the oldest written entries so at most `max_items` remain.
+
+        :return: Number of entries removed.
+        """
+        with self._lock:
+            # INSERT OR REPLACE gives a new rowid, so rowid order is write order
+            keys = [row[0] for row in self._conn.execute(
+                f"SELECT key FROM {self.table} ORDER BY rowid DESC LIMIT -1 OFFSET ?",
+                (max_items,)
+            ).fetchall()]
+            for key in keys:
+                self._memory.pop(key, None)
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in keys])
+            self._conn.commit()
+            return len(keys)
+
+    def purge_expired(self) -> int:
+        """
+        Remove expired rows from the SQLite tier.
+
+        :return: Number of rows removed.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_items": len(self._memory),
+            }
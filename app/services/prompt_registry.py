@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+from langchain_core.prompts import PromptTemplate
+
+CONTEXTUALIZE_PROMPTS_PATH = 'rag/config/contextualize_prompts.yaml'
+PROMPTS_PATH = 'rag/config/prompts.yaml'
+PROMPTS_CONFIG_PATH = 'rag/prompts_config.yaml'
+
+
+class PromptRegistry:
+    """
+    Process-wide cache of the prompt configuration files.
+
+    Each YAML file is parsed once and the prompt templates built from it are
+    compiled once. A file is parsed again, and its compiled templates
+    dropped, when its modification time changes; the modification time is
+    checked at most every `check_interval` seconds.
+    """
+
+    def __init__(self, check_interval: float = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))) -> None:
+        """
+        :param check_interval: Minimum number of seconds between two checks of a file's mtime.
+        """
+        self.check_interval = check_interval
+        # path -> (parsed config, compiled objects), replaced together on reload
+        self._entries: Dict[str, tuple] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, path: str) -> tuple:
+        now = time.monotonic()
+        if path in self._entries and now - self._checked_at[path] < self.check_interval:
+            return self._entries[path]
+
+        with self._lock:
+            mtime = os.path.getmtime(path)
+            self._checked_at[path] = now
+            if path not in self._entries or mtime != self._mtimes[path]:
+                with open(path, 'r') as file:
+                    self._entries[path] = (yaml.safe_load(file), {})
+                self._mtimes[path] = mtime
+            return self._entries[path]
+
+    def load(self, path: str) -> Dict[str, Any]:
+        """
+        Return the parsed content of a YAML prompt file.
+
+        :param path: Path of the YAML file.
+        """
+        return self._entry(path)[0]
+
+    def get_compiled(self, path: str, key: Any, build: Callable[[Dict[str, Any]], Any]) -> Any:
+        """
+        Return the object built by `build` from the content of `path`, building it once.
+
+        :param path: Path of the YAML file.
+        :param key: Cache key of the object within the file.
+        :param build: Function building the object from the parsed file.
+        """
+        config, compiled = self._entry(path)
+        if key not in compiled:
+            compiled[key] = build(config)
+        return compiled[key]
+
+    def get_template(
+        self,
+        path: str,
+        prompt_key: str,
+        placeholder_key: Optional[str] = None,
+        input_variables: Optional[List[str]] = None,
+        section: str = "system_messages",
+    ) -> PromptTemplate:
+        """
+        Return the compiled PromptTemplate of a prompt.
+
+        :param path: Path of the YAML file.
+        :param prompt_key: Key of the template text in `section`.
+        :param placeholder_key: Key of the list of input variables in `section`.
+        :param input_variables: Input variables, when they are not listed in the file.
+        :param section: Top level section of the file holding the prompts.
+        """
+        def build(config: Dict[str, Any]) -> PromptTemplate:
+            variables = config[section][placeholder_key] if placeholder_key else input_variables
+            return PromptTemplate(input_variables=variables or [], template=config[section][prompt_key])
+
+        key = ("template", section, prompt_key, placeholder_key, tuple(input_variables or ()))
+        return self.get_compiled(path, key, build)
+
+    def get_text(self, path: str, prompt_key: str, section: str = "system_messages") -> str:
+        return self.load(path)[section][prompt_key]
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from app.services.metrics import instrument
+
+# S3 rejects multipart parts smaller than 5 MB, except the last one
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(5 * 1024 * 1024)))
+
+_END = object()
+_ABORT = object()
+
+# Keeps the upload tasks alive after the response that started them is sent
+_uploads: Set[asyncio.Task] = set()
+
+
+class S3StreamUpload:
+    """
+    Upload to S3 of a stream, while it is being produced.
+
+    The producer hands chunks to `write` without waiting; a background
+    task gathers them into parts of `part_size` bytes and sends them as a
+    multipart upload, so the stream is never held in memory as a whole.
+    A stream shorter than one part is sent with a single put_object. After
+    `abort`, or if S3 fails, the multipart upload is aborted and nothing is
+    written under `key`.
+    """
+
+    def __init__(self, s3_client: Any, bucket: str, key: str, content_type: str = "audio/mpeg", part_size: int = S3_PART_SIZE) -> None:
+        """
+        :param s3_client: boto3 S3 client, called from worker threads.
+        :param bucket: Destination bucket.
+        :param key: Destination key.
+        :param content_type: Content type of the object.
+        :param part_size: Size of the uploaded parts, at least 5 MB.
+        """
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        _uploads.add(self._task)
+        self._task.add_done_callback(_uploads.discard)
+
+    def write(self, chunk: bytes) -> None:
+        # Once the upload failed nothing reads the queue anymore
+        if not self._task.done():
+            self._queue.put_nowait(chunk)
+
+    def close(self) -> None:
+        """Mark the end of the stream, the upload is completed in the background."""
+        if not self._task.done():
+            self._queue.put_nowait(_END)
+
+    def abort(self) -> None:
+        """Drop the stream, e.g. after the source failed."""
+        if not self._task.done():
+            self._queue.put_nowait(_ABORT)
+
+    async def wait(self) -> bool:
+        """Wait for the end of the upload, return whether the object was written."""
+        return await self._task
+
+    async def _run(self) -> bool:
+        buffer = bytearray()
+        parts: List[Dict[str, Any]] = []
+        upload_id: Optional[str] = None
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _ABORT:
+                    print(f"S3 upload of {self.key} aborted")
+                    await self._abort(upload_id)
+                    return False
+                if item is _END:
+                    break
+                buffer += item
+                if len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = await self._create()
+                    parts.append(await self._upload_part(upload_id, len(parts) + 1, bytes(buffer)))
+                    buffer.clear()
+
+            if upload_id is None:
+                with instrument("s3", "upload"):
+                    await asyncio.to_thread(
+                        self.s3_client.put_object,
+                        Bucket=self.bucket, Key=self.key, Body=bytes(buffer), ContentType=self.content_type,
+                    )
+            else:
+                if buffer:
+                    parts.append(await self._upload_part(upload_id, len(parts) + 1, bytes(buffer)))
+                with instrument("s3", "complete_multipart_upload"):
+                    await asyncio.to_thread(
+                        self.s3_client.complete_multipart_upload,
+                        Bucket=self.bucket, Key=self.key, UploadId=upload_id, MultipartUpload={"Parts": parts},
+                    )
+            print(f"File uploaded successfully to s3://{self.bucket}/{self.key}")
+            return True
+        except Exception as e:
+            print(f"Error uploading file to S3: {e}")
+            await self._abort(upload_id)
+            return False
+
+    async def _create(self) -> str:
+        with instrument("s3", "create_multipart_upload"):
+            response = await asyncio.to_thread(
+                self.s3_client.create_multipart_upload,
+                Bucket=self.bucket, Key=self.key, ContentType=self.content_type,
+            )
+        return response["UploadId"]
+
+    async def _upload_part(self, upload_id: str, part_number: int, data: bytes) -> Dict[str, Any]:
+        with instrument("s3", "upload_part"):
+            response = await asyncio.to_thread(
+                self.s3_client.upload_part,
+                Bucket=self.bucket, Key=self.key, UploadId=upload_id, PartNumber=part_number, Body=data,
+            )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    async def _abort(self, upload_id: Optional[str]) -> None:
+        if upload_id is None:
+            return
+        try:
+            await asyncio.to_thread(
+                self.s3_client.abort_multipart_upload,
+                Bucket=self.bucket, Key=self.key, UploadId=upload_id,
+            )
+        except Exception as e:
+            print(f"Error aborting the S3 upload of {self.key}: {e}")
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, the cross-worker lock is then disabled
+    fcntl = None
+
+SINGLE_FLIGHT_LOCK_DIR = os.getenv("SINGLE_FLIGHT_LOCK_DIR", "")
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls.
+
+    While a call for a key is in flight, other callers with the same key wait
+    for its result instead of calling the provider again. Calls given a
+    `recheck` function can also be coalesced across worker processes: with
+    SINGLE_FLIGHT_LOCK_DIR set, one worker at a time holds a file lock per
+    key, and the others re-read the shared cache through `recheck` once they
+    get the lock, so the provider is called once per host.
+    """
+
+    def __init__(self, name: str, lock_dir: str = SINGLE_FLIGHT_LOCK_DIR) -> None:
+        """
+        :param name: Name of the coalesced call, used in lock file names and stats.
+        :param lock_dir: Directory of the cross-worker lock files, empty to coalesce in-process only.
+        """
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else ""
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self.calls = 0
+        self.shared = 0
+
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _lock_path(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.lock_dir, f"{self.name}-{digest}.lock")
+
+    def _acquire_file_lock(self, key: str):
+        lock_file = open(self._lock_path(key), "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    @staticmethod
+    def _release_file_lock(lock_file) -> None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]], recheck: Optional[Callable[[], Any]]) -> Any:
+        if not self.lock_dir or recheck is None:
+            return await fn()
+        lock_file = await asyncio.to_thread(self._acquire_file_lock, key)
+        try:
+            # Another worker may have filled the cache while we waited for the lock
+            cached = recheck()
+            if cached is not None:
+                return cached
+            return await fn()
+        finally:
+            self._release_file_lock(lock_file)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], recheck: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Run `fn`, or wait for the call already in flight for `key`.
+
+        :param key: Identity of the call, e.g. the normalized query.
+        :param fn: Coroutine function making the call.
+        :param recheck: Function reading the shared cache, None if the result is not cached.
+        :return: The result of the call.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            # The call runs in its own task, so a cancelled caller does not cancel it for the others
+            task = asyncio.ensure_future(self._run(key, fn, recheck))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved, every waiter has already received it
+            task.exception()
+
+    def do_sync(self, key: str, fn: Callable[[], Any], recheck: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Thread-safe equivalent of `do` for blocking calls.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                self.calls += 1
+                future = Future()
+                self._futures[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            if self.lock_dir and recheck is not None:
+                lock_file = self._acquire_file_lock(key)
+                try:
+                    result = recheck()
+                    if result is None:
+                        result = fn()
+                finally:
+                    self._release_file_lock(lock_file)
+            else:
+                result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._futures[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._tasks) + len(self._futures)}
@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.services.metrics import instrument, register_stats
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", ".cache/tts")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+# Bucket of the shared S3 tier, empty to keep the cache on the local disk only
+TTS_CACHE_BUCKET = os.getenv("TTS_CACHE_BUCKET", "")
+TTS_CACHE_PREFIX = os.getenv("TTS_CACHE_PREFIX", "tts-cache/")
+TTS_CACHE_S3_MAX_BYTES = int(os.getenv("TTS_CACHE_S3_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+# Seconds between two trims of the S3 tier by a worker
+TTS_CACHE_S3_TRIM_INTERVAL = float(os.getenv("TTS_CACHE_S3_TRIM_INTERVAL", "3600"))
+# Files used this recently are never evicted, a hit stays on disk until its response is sent
+TTS_CACHE_GRACE_SECONDS = 60
+# Eviction goes below the cap, so it does not run again on the next put
+TTS_CACHE_LOW_WATER = 0.9
+
+# Keeps the S3 tasks alive after the response that started them is sent
+_tasks: Set[asyncio.Task] = set()
+
+
+def _background(coroutine) -> None:
+    task = asyncio.create_task(coroutine)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio.
+
+    An audio file is identified by the provider, voice, model, voice
+    settings and normalized text it was synthesized from. Files are kept
+    on the local disk, evicting the least recently used beyond `max_bytes`,
+    and in an optional S3 tier shared by every instance, which refills the
+    disk after a restart or on another server.
+
+    The size of the disk tier is tracked in memory; the directory is only
+    walked once at start and when the tracked size exceeds the cap, which
+    also corrects the drift caused by other workers sharing it. The S3 tier
+    is trimmed the same way beyond `s3_max_bytes` every
+    TTS_CACHE_S3_TRIM_INTERVAL, ordered by last modification, which S3
+    hits refresh.
+    """
+
+    def __init__(
+        self,
+        directory: str = TTS_CACHE_DIR,
+        max_bytes: int = TTS_CACHE_MAX_BYTES,
+        s3_client: Any = None,
+        bucket: str = TTS_CACHE_BUCKET,
+        prefix: str = TTS_CACHE_PREFIX,
+        s3_max_bytes: int = TTS_CACHE_S3_MAX_BYTES,
+    ) -> None:
+        """
+        :param directory: Directory of the disk tier.
+        :param max_bytes: Size of the disk tier above which the least recently used files are removed.
+        :param s3_client: boto3 S3 client of the S3 tier, created on first use if `bucket` is set.
+        :param bucket: Bucket of the S3 tier, empty to disable it.
+        :param prefix: Prefix of the keys of the S3 tier.
+        :param s3_max_bytes: Size of the S3 tier above which the least recently used objects are removed.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_max_bytes = s3_max_bytes
+        self._s3_client = s3_client
+        # Tracked size of the disk tier, None until the first walk
+        self._size: Optional[int] = None
+        self._size_lock = threading.Lock()
+        # When recent files kept the disk tier over the cap, no walk before this time
+        self._evict_after = 0.0
+        self._s3_trimmed_at = 0.0
+        self.hits = 0
+        self.s3_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def s3_client(self) -> Any:
+        if self._s3_client is None:
+            import boto3
+
+            self._s3_client = boto3.client("s3")
+        return self._s3_client
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        # Case and punctuation change the intonation, only the spacing is normalized
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def key(cls, provider: str, voice: str, model: str, settings: Dict[str, Any], text: str) -> str:
+        """
+        :param provider: TTS provider, e.g. "elevenlabs" or "openai".
+        :param voice: Voice id of the provider.
+        :param model: Model of the provider.
+        :param settings: Voice settings sent to the provider.
+        :param text: Synthesized text.
+        """
+        identity = json.dumps([provider, voice, model, settings, cls.normalize_text(text)], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def s3_key(self, key: str) -> str:
+        return f"{self.prefix}{key}.mp3"
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return the path of the cached audio of `key`, fetched from S3 if it is not on disk, None on a miss."""
+        path = self.path(key)
+        try:
+            # The modification time orders the eviction, and protects the file until it is sent
+            os.utime(path)
+            self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+        if self.bucket:
+            try:
+                with instrument("s3", "tts_cache_get"):
+                    size = await asyncio.to_thread(self._download, key, path)
+                self.s3_hits += 1
+                _background(self._touch(key))
+                await asyncio.to_thread(self._grow, size)
+                return path
+            except Exception as e:
+                # Missing objects are the normal case of a miss
+                if "404" not in str(e) and "NoSuchKey" not in str(e):
+                    print(f"Error reading the TTS cache from S3: {e}")
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, audio: bytes) -> None:
+        """Store the audio of `key` on disk, and on S3 in the background."""
+        try:
+            await asyncio.to_thread(self._write, self.path(key), audio)
+            await asyncio.to_thread(self._grow, len(audio))
+        except Exception as e:
+            print(f"Error writing the TTS cache: {e}")
+        if self.bucket:
+            _background(self._upload(key, audio))
+            if time.time() - self._s3_trimmed_at >= TTS_CACHE_S3_TRIM_INTERVAL:
+                self._s3_trimmed_at = time.time()
+                _background(self._trim_s3())
+
+    def copy_to(self, key: str, bucket: str, destination: str) -> None:
+        """
+        Copy the cached audio of `key` to `destination` in `bucket` in the
+        background, e.g. the key where a message's audio is saved for replay.
+        """
+        _background(self._copy(key, bucket, destination))
+
+    def evict(self) -> None:
+        """Remove the least recently used files until the disk tier fits in `max_bytes`."""
+        with self._size_lock:
+            files = self._scan()
+            total = sum(size for _, size, _ in files)
+            if total > self.max_bytes:
+                recent = time.time() - TTS_CACHE_GRACE_SECONDS
+                for mtime, size, path in sorted(files):
+                    if total <= self.max_bytes * TTS_CACHE_LOW_WATER or mtime > recent:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    self.evictions += 1
+                    total -= size
+            self._size = total
+            # Only files still in their grace period are left, walking again before it ends would not free anything
+            self._evict_after = time.time() + TTS_CACHE_GRACE_SECONDS if total > self.max_bytes else 0.0
+
+    def trim_s3(self) -> int:
+        """Remove the least recently used objects until the S3 tier fits in `s3_max_bytes`, return how many."""
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        objects = [
+            item for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix)
+            for item in page.get("Contents", [])
+        ]
+        total = sum(item["Size"] for item in objects)
+        removed = []
+        for item in sorted(objects, key=lambda item: item["LastModified"]):
+            if total <= self.s3_max_bytes * TTS_CACHE_LOW_WATER:
+                break
+            removed.append({"Key": item["Key"]})
+            total -= item["Size"]
+        # delete_objects takes at most 1000 keys
+        for start in range(0, len(removed), 1000):
+            self.s3_client.delete_objects(Bucket=self.bucket, Delete={"Objects": removed[start:start + 1000], "Quiet": True})
+        return len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "s3_hits": self.s3_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes": self._size,
+        }
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _grow(self, size: int) -> None:
+        """Count `size` new bytes on disk, evicting when the tracked size exceeds the cap."""
+        with self._size_lock:
+            if self._size is not None:
+                self._size += size
+                if self._size <= self.max_bytes or time.time() < self._evict_after:
+                    return
+        # First call, or over the cap: the walk gives the actual size
+        self.evict()
+
+    @staticmethod
+    def _write(path: str, audio: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside then renamed, readers never see a partial file
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, "wb") as audio_file:
+            audio_file.write(audio)
+        os.replace(temporary, path)
+
+    def _download(self, key: str, path: str) -> int:
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=self.s3_key(key))
+        audio = response["Body"].read()
+        self._write(path, audio)
+        return len(audio)
+
+    async def _touch(self, key: str) -> None:
+        # Copying an object onto itself refreshes its last modification, which orders the trim
+        try:
+            with instrument("s3", "tts_cache_touch"):
+                await asyncio.to_thread(
+                    self.s3_client.copy_object,
+                    CopySource={"Bucket": self.bucket, "Key": self.s3_key(key)}, Bucket=self.bucket, Key=self.s3_key(key),
+                    MetadataDirective="REPLACE", ContentType="audio/mpeg",
+                )
+        except Exception as e:
+            print(f"Error refreshing the TTS cache on S3: {e}")
+
+    async def _trim_s3(self) -> None:
+        try:
+            with instrument("s3", "tts_cache_trim"):
+                removed = await asyncio.to_thread(self.trim_s3)
+            if removed:
+                print(f"Removed {removed} files from the TTS cache on S3")
+        except Exception as e:
+            print(f"Error trimming the TTS cache on S3: {e}")
+
+    async def _upload(self, key: str, audio: bytes) -> None:
+        try:
+            with instrument("s3", "tts_cache_put"):
+                await asyncio.to_thread(
+                    self.s3_client.put_object,
+                    Bucket=self.bucket, Key=self.s3_key(key), Body=audio, ContentType="audio/mpeg",
+                )
+        except Exception as e:
+            print(f"Error writing the TTS cache to S3: {e}")
+
+    async def _copy(self, key: str, bucket: str, destination: str) -> None:
+        if self.bucket:
+            try:
+                # Server-side copy, the audio does not go through this server again
+                with instrument("s3", "copy"):
+                    await asyncio.to_thread(
+                        self.s3_client.copy_object,
+                        CopySource={"Bucket": self.bucket, "Key": self.s3_key(key)}, Bucket=bucket, Key=destination,
+                    )
+                print(f"File copied successfully to s3://{bucket}/{destination}")
+                return
+            except Exception as e:
+                # The S3 tier may not have the audio yet, the disk tier is uploaded instead
+                print(f"Error copying from the TTS cache on S3, uploading from disk: {e}")
+        try:
+            with instrument("s3", "upload"):
+                await asyncio.to_thread(self.s3_client.upload_file, self.path(key), bucket, destination)
+            print(f"File uploaded successfully to s3://{bucket}/{destination}")
+        except Exception as e:
+            print(f"Error uploading file to S3: {e}")
+
+
+tts_cache = TTSCache()
+register_stats("tts_cache", tts_cache.stats)
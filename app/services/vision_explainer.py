@@ -0,0 +1,212 @@
+import asyncio
+import base64
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from typing import Any, AsyncGenerator, Dict, List
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.services.client_registry import client_registry
+from app.services.concurrency_limiter import ConcurrencyLimiter, QueueFullError
+from app.services.image_preprocessing import PreparedImage, UnsupportedImageError, prepare_image
+from app.services.metrics import instrument, record_tokens, register_stats
+from app.services.persistent_cache import PersistentCache
+from app.services.single_flight import SingleFlight
+
+# The same worksheet photographed by several students is explained once
+vision_flight = SingleFlight("vision")
+vision_cache = PersistentCache(
+    os.getenv("VISION_CACHE_PATH", ".cache/vision.sqlite3"),
+    table="vision",
+    ttl=float(os.getenv("VISION_CACHE_TTL", str(30 * 24 * 3600))),
+)
+VISION_TIMEOUT = float(os.getenv("VISION_TIMEOUT", "60"))
+# Vision calls in flight per worker, and requests allowed to wait for one; beyond that the endpoints answer 503
+vision_limiter = ConcurrencyLimiter(
+    "vision",
+    max_concurrency=int(os.getenv("VISION_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("VISION_MAX_QUEUE", "32")),
+)
+register_stats("vision_single_flight", vision_flight.stats)
+register_stats("vision_limiter", vision_limiter.stats)
+register_stats("vision_cache", vision_cache.stats)
+
+
+class VisionExplainer(ABC):
+    """
+    Explanation of an uploaded image by an OpenAI vision model.
+
+    Images are normalized before the call and explanations are cached by
+    model, system prompt and image hash. Concurrent requests for the same
+    image share one call, and async calls are limited by `vision_limiter`
+    and bounded by VISION_TIMEOUT. Subclasses provide the system prompt.
+    """
+
+    def __init__(self, model_name: str = "gpt-4o") -> None:
+        self.model = model_name
+        self.client = client_registry.openai()
+        self.async_client = client_registry.async_openai()
+
+    @property
+    @abstractmethod
+    def system_message(self) -> str:
+        """System prompt sent with every image."""
+
+    def encode_image(self, image_bytes: bytes) -> str:
+        return base64.b64encode(image_bytes).decode('utf-8')
+
+    def cache_key(self, image: PreparedImage) -> str:
+        # A new system prompt gives new explanations
+        prompt_hash = hashlib.sha256(self.system_message.encode("utf-8")).hexdigest()[:16]
+        return f"{self.model}:{prompt_hash}:{image.sha256}"
+
+    def vision_messages(self, image: PreparedImage) -> List[Dict]:
+        base64_image = self.encode_image(image.data)
+
+        return [
+            {"role": "system", "content": self.system_message},
+            {"role": "user", "content": [
+                {"type": "image_url", "image_url": {
+                    "url": f"data:{image.media_type};base64,{base64_image}"}
+                }
+            ]}
+        ]
+
+    def _explanation(self, response, key: str) -> str:
+        record_tokens(self.model, response.usage.model_dump() if response.usage else None)
+        explanation = response.choices[0].message.content
+        if explanation:
+            vision_cache.set(key, explanation)
+        return explanation
+
+    def step_explanation(self, image_bytes: bytes) -> str:
+        image = prepare_image(image_bytes)
+        key = self.cache_key(image)
+        cached = vision_cache.get(key)
+        if cached is not None:
+            return cached
+        return vision_flight.do_sync(key, lambda: self._step_explanation(image, key), recheck=lambda: vision_cache.get(key))
+
+    def _step_explanation(self, image: PreparedImage, key: str) -> str:
+        with instrument("openai", "vision"):
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self.vision_messages(image),
+                timeout=VISION_TIMEOUT,
+            )
+        return self._explanation(response, key)
+
+    async def astep_explanation(self, image_bytes: bytes) -> str:
+        """
+        Non-blocking step_explanation, limited by vision_limiter and VISION_TIMEOUT.
+
+        Raises QueueFullError when too many requests are waiting and
+        asyncio.TimeoutError when the explanation takes too long.
+        """
+        image = await asyncio.to_thread(prepare_image, image_bytes)
+        key = self.cache_key(image)
+        cached = vision_cache.get(key)
+        if cached is not None:
+            return cached
+        return await vision_flight.do(key, lambda: self._astep_explanation(image, key), recheck=lambda: vision_cache.get(key))
+
+    async def _astep_explanation(self, image: PreparedImage, key: str) -> str:
+        # The deadline runs inside the shared call, so a timeout also frees the limiter slot and the connection
+        return await asyncio.wait_for(self._limited_explanation(image, key), timeout=VISION_TIMEOUT)
+
+    async def _limited_explanation(self, image: PreparedImage, key: str) -> str:
+        async with vision_limiter, instrument("openai", "vision"):
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=self.vision_messages(image),
+            )
+        return self._explanation(response, key)
+
+    async def astream_explanation(self, image_bytes: bytes) -> AsyncGenerator[str, None]:
+        """
+        Stream the explanation of an image as it is generated.
+
+        Same limits as astep_explanation; VISION_TIMEOUT bounds the whole stream.
+        Streams are not coalesced, but a finished explanation is cached for
+        the next duplicate.
+        """
+        image = await asyncio.to_thread(prepare_image, image_bytes)
+        key = self.cache_key(image)
+        cached = vision_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        deadline = asyncio.get_running_loop().time() + VISION_TIMEOUT
+
+        def remaining() -> float:
+            return max(deadline - asyncio.get_running_loop().time(), 0)
+
+        async with vision_limiter, instrument("openai", "vision_stream"):
+            stream = await asyncio.wait_for(
+                self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=self.vision_messages(image),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+                timeout=remaining()
+            )
+            explanation = ""
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=remaining())
+                    except StopAsyncIteration:
+                        break
+                    if chunk.usage:
+                        record_tokens(self.model, chunk.usage.model_dump())
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        explanation += chunk.choices[0].delta.content
+                        yield chunk.choices[0].delta.content
+            finally:
+                # Frees the connection when the client disconnects or the stream times out
+                await stream.close()
+        if explanation:
+            vision_cache.set(key, explanation)
+
+
+async def explanation_response(explainer: VisionExplainer, image: UploadFile, stream: bool) -> Any:
+    """
+    Body of the /api/multimodal endpoints: explain `image`, streamed or not.
+
+    Maps unsupported images to 400, a full vision queue to 503 and a
+    timeout to 504, so every app serving the endpoint behaves the same.
+    """
+    try:
+
+        contents = await image.read()
+
+        if stream:
+            explanation = explainer.astream_explanation(contents)
+            # Wait for the first chunk, so a full queue or a timeout is still reported with a status code
+            first_chunk = await explanation.__anext__()
+
+            async def stream_response():
+                yield first_chunk
+                async for chunk in explanation:
+                    yield chunk
+
+            return StreamingResponse(stream_response(), media_type="text/plain")
+
+        response = await explainer.astep_explanation(contents)
+        print(response)
+
+        return {"response" : response }
+    except UnsupportedImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="The image explanation timed out")
+    except StopAsyncIteration:
+        return StreamingResponse(iter(()), media_type="text/plain")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,11 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from whisper import audio_to_text
-import io
-import tempfile
-from pydub import AudioSegment
+from whisper import long_audio_to_text, stream_transcription
+from app.services.audio_transcoding import AudioDecodeError, transcode_for_speech_chunks, shutdown_transcoding
 import logging
 from app.config import settings
+from app.services.metrics import setup_metrics
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -22,9 +21,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+setup_metrics(app)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_transcoding()
 
 @app.post("/transcribe")
-async def transcribe_audio(audio: UploadFile = File(...)):
+async def transcribe_audio(audio: UploadFile = File(...), stream: bool = Form(False)):
     try:
         # Read the uploaded file into memory
         audio_bytes = await audio.read()
@@ -34,24 +38,18 @@ async def transcribe_audio(audio: UploadFile = File(...)):
         file_format = audio.filename.split('.')[-1].lower()
         logger.debug(f"Detected file format: {file_format}")
 
-        # Convert the audio to wav format (which is more widely supported)
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-            try:
-                audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format="webm")
-                logger.debug("Successfully read audio file")
-            except Exception as e:
-                logger.error(f"Error reading audio file: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Error reading audio file: {str(e)}")
-
-            audio.export(temp_file.name, format="wav")
-            logger.debug(f"Exported audio to WAV format: {temp_file.name}")
-
-            # Read the converted wav file
-            with open(temp_file.name, "rb") as wav_file:
-                wav_bytes = wav_file.read()
-
-        # Transcribe the audio
-        transcription = audio_to_text(wav_bytes)
+        # Convert the audio to 16 kHz mono wav pieces split on silences, in the transcoding process pool
+        try:
+            chunks = await transcode_for_speech_chunks(audio_bytes, "webm")
+            logger.debug(f"Converted audio to {len(chunks)} WAV chunks")
+        except AudioDecodeError as e:
+            logger.error(f"Error reading audio file: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Error reading audio file: {str(e)}")
+
+        # Transcribe the pieces concurrently, streamed as NDJSON as they finish if requested
+        if stream:
+            return StreamingResponse(stream_transcription(chunks), media_type="application/x-ndjson")
+        transcription = await long_audio_to_text(chunks)
         logger.debug("Transcription completed successfully")
         return JSONResponse(content={"transcription": transcription})
     except Exception as e:
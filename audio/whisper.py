@@ -1,8 +1,12 @@
-from openai import OpenAI
+import asyncio
+import json
 import os
 import io
+from typing import AsyncGenerator, List, Tuple
 from dotenv import load_dotenv
 import logging
+from app.services.client_registry import client_registry
+from app.services.metrics import instrument
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -10,19 +14,77 @@ logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+async_client = client_registry.async_openai(api_key=os.environ["OPENAI_API_KEY"])
 
-def audio_to_text(audio_bytes):
+# Pieces of one recording transcribed at the same time
+WHISPER_MAX_CONCURRENCY = int(os.getenv("WHISPER_MAX_CONCURRENCY", "4"))
+
+
+async def aaudio_to_text(audio_bytes: bytes) -> str:
     buffer = io.BytesIO(audio_bytes)
-    buffer.name = "audio.wav"  # Explicitly set the filename
+    buffer.name = "audio.wav"
     try:
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=buffer,
-            response_format="text"
-        )
-        logger.debug("Transcription successful")
-        return transcript
+        with instrument("openai", "whisper"):
+            transcript = await async_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=buffer,
+                response_format="text"
+            )
+        return transcript.strip()
     except Exception as e:
-        logger.error(f"Error in audio_to_text: {str(e)}")
+        logger.error(f"Error in aaudio_to_text: {str(e)}")
         raise
+
+
+async def transcribe_chunks(chunks: List[bytes]) -> AsyncGenerator[Tuple[int, str], None]:
+    """
+    Transcribe the pieces of a recording concurrently, at most
+    WHISPER_MAX_CONCURRENCY at a time.
+
+    :param chunks: WAV pieces of the recording, in order.
+    :return: The index and text of each piece, as soon as it is transcribed.
+    """
+    semaphore = asyncio.Semaphore(WHISPER_MAX_CONCURRENCY)
+
+    async def transcribe(index: int, chunk: bytes) -> Tuple[int, str]:
+        async with semaphore:
+            return index, await aaudio_to_text(chunk)
+
+    tasks = [asyncio.create_task(transcribe(index, chunk)) for index, chunk in enumerate(chunks)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # The client went away or a piece failed, the other requests are not needed anymore
+        for task in tasks:
+            task.cancel()
+
+
+def stitch(texts: List[str]) -> str:
+    return " ".join(text for text in texts if text)
+
+
+async def long_audio_to_text(chunks: List[bytes]) -> str:
+    """Transcribe the pieces of a recording concurrently and join their texts in order."""
+    texts = [""] * len(chunks)
+    async for index, text in transcribe_chunks(chunks):
+        texts[index] = text
+    logger.debug(f"Transcribed {len(chunks)} audio chunks")
+    return stitch(texts)
+
+
+async def stream_transcription(chunks: List[bytes]) -> AsyncGenerator[str, None]:
+    """
+    Transcribe the pieces of a recording as NDJSON lines: one
+    {"index", "text", "chunks"} line per piece as soon as it is transcribed,
+    then a {"transcription"} line with the whole text in order.
+    """
+    texts = [""] * len(chunks)
+    try:
+        async for index, text in transcribe_chunks(chunks):
+            texts[index] = text
+            yield json.dumps({"index": index, "text": text, "chunks": len(chunks)}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+        return
+    yield json.dumps({"transcription": stitch(texts)}) + "\n"
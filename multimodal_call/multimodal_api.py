@@ -1,14 +1,14 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.middleware.cors import CORSMiddleware
-from multimodal_model import MultimodalOpenAI
-
-
 # Add the parent directory to the Python path
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, UploadFile, File, Form
+from fastapi.middleware.cors import CORSMiddleware
+from multimodal_model import MultimodalOpenAI
+from app.services.vision_explainer import explanation_response
 from app.config import settings
-from app.config import settings
+from app.services.metrics import setup_metrics
 
 
 app = FastAPI()
@@ -21,21 +21,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+setup_metrics(app)
+
+multimodal = MultimodalOpenAI()
 
 @app.post("/api/multimodal")
-async def image_comprehension(image: UploadFile = File(...)):
+async def image_comprehension(image: UploadFile = File(...), stream: bool = Form(False)):
     print("Received image comprehension request")
-    multimodal = MultimodalOpenAI()
-    try:
-
-        contents = await image.read()
-
-        response = multimodal.step_explanation(contents)
-        print(response)
-
-        return {"response" : response }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await explanation_response(multimodal, image, stream)
 
 if __name__ == "__main__":
     import uvicorn
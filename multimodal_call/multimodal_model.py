@@ -1,47 +1,24 @@
-import base64
-import requests
 import os
-import json
-import yaml
-from openai import OpenAI
 from dotenv import load_dotenv
+from app.services.client_registry import client_registry
+from app.services.image_preprocessing import prepare_image
+from app.services.metrics import instrument, record_tokens
+from app.services.prompt_registry import prompt_registry, CONTEXTUALIZE_PROMPTS_PATH
+from app.services.vision_explainer import VisionExplainer
 from geometry_data_class import MathReasoning
 # Load environment variables
 load_dotenv("/etc/secrets/.env")
-class MultimodalOpenAI:
 
-    def __init__(self, model_name = "gpt-4o") -> None:
+class MultimodalOpenAI(VisionExplainer):
 
-        self.model = model_name
-        self.client = OpenAI()
-        with open('rag/config/contextualize_prompts.yaml', 'r') as file:
-            self.prompts = yaml.safe_load(file)
-        self.system_message = self.prompts["system_messages"]["image_prompt"]
-
-    def encode_image(self, image_bytes: bytes) -> str:
-        return base64.b64encode(image_bytes).decode('utf-8')
-
-    def step_explanation(self, image_bytes : bytes):
-
-        base64_image = self.encode_image(image_bytes)
-
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": self.system_message},
-                {"role": "user", "content": [
-                    {"type": "image_url", "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image}"}
-                    }
-                ]}
-            ],
-        )
-
-        return response.choices[0].message.content
+    @property
+    def system_message(self) -> str:
+        return prompt_registry.get_text(CONTEXTUALIZE_PROMPTS_PATH, "image_prompt")
 
     def extract_explanation(self, image_bytes: bytes):
 
-        base64_image = self.encode_image(image_bytes)
+        image = prepare_image(image_bytes)
+        base64_image = self.encode_image(image.data)
 
         headers = {
           "Content-Type": "application/json",
@@ -63,7 +40,7 @@ class MultimodalOpenAI:
                 {
                   "type": "image_url",
                   "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64_image}"
+                    "url": f"data:{image.media_type};base64,{base64_image}"
                   }
                 }
               ]
@@ -72,6 +49,9 @@ class MultimodalOpenAI:
           "max_tokens": 300
         }
 
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
+        with instrument("openai", "vision"):
+            response = client_registry.http_client().post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
         print("multimodal 3")
-        return response.json()["choices"][0]["message"]["content"]
+        result = response.json()
+        record_tokens(self.model, result.get("usage"))
+        return result["choices"][0]["message"]["content"]
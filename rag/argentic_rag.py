@@ -1,8 +1,16 @@
+import sys
+import os
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Dict, Any, Optional
 from uuid import uuid4
 from chatbot import Chatbot
+from multimodal_client import MultimodalClient
+from session_store import build_session_store
 from pydantic import BaseModel
 from fastapi.responses import StreamingResponse
 import time
@@ -10,12 +18,8 @@ import asyncio
 from fastapi import Response
 from uuid import uuid4
 
-import sys
-import os
-
-# Add the parent directory to the Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.config import settings
+from app.services.metrics import setup_metrics
 
 
 
@@ -28,9 +32,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+setup_metrics(app)
 
 chatbot = Chatbot()
-sessions: Dict[str, Dict[str, Any]] = {}
+sessions = build_session_store()
 
 class ChatInput(BaseModel):
     """
@@ -46,10 +51,15 @@ class ChatInput(BaseModel):
     extracted_text: Optional[str]
 
 
+def new_state() -> Dict[str, Any]:
+    return {"messages": [], "first_user_message": ""}
+
 def get_or_create_session(session_id: str) -> Dict[str, Any]:
-    if session_id not in sessions:
-        sessions[session_id] = {"messages": [], "first_user_message": ""}
-    return sessions[session_id]
+    return sessions.get_or_create(session_id, new_state)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await MultimodalClient.aclose()
 
 @app.post("/api/argentic_chat")
 async def chat(
@@ -92,7 +102,7 @@ async def chat(
 
         print(f"Processing input type: {type(user_input)}")
         updated_state = await chatbot.process_input(user_input, session)
-        sessions[session_id] = updated_state
+        sessions.save(session_id, updated_state)
 
         async def stream_response():
             # Get the last message, which should be the chatbot's response
@@ -110,7 +120,7 @@ async def chat(
 @app.post("/new_session")
 async def new_session(response: Response, request: Request):
     session_id = str(uuid4())
-    sessions[session_id] = {"messages": [], "first_user_message": ""}
+    sessions.save(session_id, new_state())
 
     origin = request.headers.get("Origin")
 
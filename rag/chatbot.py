@@ -5,13 +5,26 @@ from prompt_builder import PromptBuilder
 from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import StateGraph
 from user_analysis import UserAnalysis
+from multimodal_client import MultimodalClient
 from typing import Dict, Any, Union
-import aiohttp
 from fastapi import UploadFile
 import json
 import tempfile
 import os
 import aiofiles
+import asyncio
+import time
+
+
+def timed_node(name: str, node):
+    """Wrap a graph node so its latency is reported in the node_timings of the state."""
+    async def run(state: State) -> dict:
+        started_at = time.perf_counter()
+        update = node(state)
+        if asyncio.iscoroutine(update):
+            update = await update
+        return {**update, "node_timings": {name: time.perf_counter() - started_at}}
+    return run
 
 
 class Chatbot(UserAnalysis):
@@ -21,85 +34,67 @@ class Chatbot(UserAnalysis):
         self.graph = self.build_graph()
         self.vector_store = OpenAIChromaVectorStore(collection_name="toru_with_school_level")
         self.retriever = self.vector_store.as_retriever(filter_store={"school_level" : "6e"}) #modifier le niveau pour le récupérer depuis le profil utilisateur
-        self.multimodal_api_url = "http://localhost:8003/api/multimodal"
-        #self.multimodal_api_url = os.environ["MULTIMODAL_URL"]
+        self.multimodal = MultimodalClient(os.getenv("MULTIMODAL_API_URL", "http://localhost:8003/api/multimodal"))
 
     async def process_image(self, image_data: Dict[str, Any]) -> str:
-        async with aiohttp.ClientSession() as session:
-            data = aiohttp.FormData()
+        return await self.multimodal.explain(image_data)
 
-            # Use the image content directly
-            data.add_field('image',
-                           image_data['content'],
-                           filename=image_data['filename'],
-                           content_type=image_data['content_type'])
+    async def retrieve_lesson(self, state: State) -> dict:
+        # Only depends on the first message, so it runs in parallel with the user analysis
+        #ici la requête du doc retriever se fait avec le premier message uniquement, à modifier
+        docs = await self.retriever.ainvoke(state["messages"][0].content)
 
-            try:
-                # Disable SSL verification for localhost
-                async with session.post(self.multimodal_api_url, data=data, ssl=False) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result['response']
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"Error from multimodal API: Status {response.status}, {error_text}")
-            except aiohttp.ClientConnectorError as e:
-                raise Exception(f"Unable to connect to multimodal API: {str(e)}")
-            except Exception as e:
-                raise
-
-    async def generate_response(self, state: State) -> State:
-        last_message = state["messages"][-1]
+        lesson_example = ""
+        for elt in range(len(docs)):
+            lesson_example += docs[elt].page_content
+        return {"lesson_example": lesson_example}
+
+    async def generate_response(self, state: State) -> dict:
+        messages = list(state["messages"])
+        update = {}
+        last_message = messages[-1]
         if isinstance(last_message.content, str):
             try:
                 content_dict = json.loads(last_message.content)
                 if 'image' in content_dict and state.get("is_geometry", False):
                     image_description = content_dict['extracted_text']
-                    state["image_description"] = image_description
-                    state["messages"][-1] = HumanMessage(content=f"[Image Description]: {image_description}")
+                    update["image_description"] = image_description
+                    messages[-1] = HumanMessage(content=f"[Image Description]: {image_description}")
             except json.JSONDecodeError:
                 # If it's not JSON, it's a regular text message, so we don't need to do anything special
                 pass
 
-        #ici la requête du doc retriever se fait avec le premier message uniquement, à modifier
-        docs = self.retriever.invoke(state["messages"][0].content)
-
-        lesson_example = ""
-        for elt in range(len(docs)):
-            lesson_example += docs[elt].page_content
-        state["lesson_example"] = lesson_example
-
-        prompt_builder = PromptBuilder(state)
+        prompt_builder = PromptBuilder({**state, "messages": messages})
         prompt = prompt_builder.build_prompt()
         #print(f"PROMPT : {prompt}")
         response = await self.llm.ainvoke(prompt)
 
         new_message = SystemMessage(content=response.content)
         print(f"LLM RESPONSE : {new_message}")
-        state["messages"].append(new_message)
-        state["end_conversation"] = True
+        messages.append(new_message)
 
-        return state
+        return {**update, "messages": messages, "end_conversation": True}
 
-    def get_user_input(self, state: State) -> State:
+    def get_user_input(self, state: State) -> dict:
         if "response_count" not in state:
-            state["response_count"] = 0
-        else:
-            state["response_count"] += 1
-        return state
+            return {"response_count": 0}
+        return {"response_count": state["response_count"] + 1}
 
     def build_graph(self):
         print("Building graph...")
         graph_builder = StateGraph(State)
 
-        graph_builder.add_node("user_input", self.get_user_input)
-        graph_builder.add_node("user_analysis", self.user_analysis)
-        graph_builder.add_node("chatbot", self.generate_response)
+        graph_builder.add_node("user_input", timed_node("user_input", self.get_user_input))
+        graph_builder.add_node("user_analysis", timed_node("user_analysis", self.user_analysis))
+        graph_builder.add_node("retrieval", timed_node("retrieval", self.retrieve_lesson))
+        graph_builder.add_node("chatbot", timed_node("chatbot", self.generate_response))
 
         graph_builder.set_entry_point("user_input")
 
+        # The analysis and the retrieval run as parallel branches, the chatbot waits for both
         graph_builder.add_edge("user_input", "user_analysis")
-        graph_builder.add_edge("user_analysis", "chatbot")
+        graph_builder.add_edge("user_input", "retrieval")
+        graph_builder.add_edge(["user_analysis", "retrieval"], "chatbot")
 
         compiled_graph = graph_builder.compile()
         return compiled_graph
@@ -121,10 +116,12 @@ class Chatbot(UserAnalysis):
         else:
             raise ValueError(f"Invalid input format: {type(user_input)}")
 
-        async for event in self.graph.astream(state):
-            if isinstance(event, dict):
-                state = event[list(event.keys())[0]]
+        state["node_timings"] = {}
+        started_at = time.perf_counter()
+        async for values in self.graph.astream(state, stream_mode="values"):
+            state = values
             if state.get("end_conversation", False):
                 break
 
+        print(f"GRAPH NODE TIMINGS : {state['node_timings']} TOTAL : {time.perf_counter() - started_at}")
         return state
@@ -1,6 +1,11 @@
 from langchain_core.messages import  BaseMessage
 from langchain_core.pydantic_v1 import BaseModel, Field
-from typing import TypedDict
+from typing import Annotated, TypedDict
+
+
+def merge_timings(left: dict, right: dict) -> dict:
+    # Nodes running in parallel each report their own latency
+    return {**(left or {}), **(right or {})}
 
 class MathState(TypedDict):
 
@@ -11,6 +16,7 @@ class MathState(TypedDict):
     is_geometry : bool
     lesson_example : str
     solution: str
+    wolfram_query: str
     intermediate_calculation : list[str]
     intermediate_solution : list[str]
     intermediate_calculation_explanation : list[str]
@@ -44,6 +50,7 @@ class State(TypedDict):
     introduction : bool
     response_count : int
     good_answer : bool
+    node_timings : Annotated[dict, merge_timings]
 
 class StudentStateIntroduction(BaseModel):
     # This data class encapsulate the current state of the student to be used by the user_analysis_introduction step
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import threading
+from array import array
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+from app.services.metrics import instrument, record_tokens, register_stats
+from app.services.persistent_cache import PersistentCache
+
+
+def _dumps_embedding(embedding: List[float]) -> bytes:
+    return array("f", embedding).tobytes()
+
+
+def _loads_embedding(raw: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(raw)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """
+    Content-hash keyed embedding cache with request batching.
+
+    Lookups go through an in-memory LRU, then a SQLite file that survives
+    restarts. Texts that are not cached yet are queued for a short window so
+    that concurrent callers share a single embeddings API call, and a text
+    already queued or being embedded is never requested twice.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        model: str,
+        path: str = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3"),
+        max_memory_items: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096")),
+        max_batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+        max_wait: float = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10")) / 1000,
+    ) -> None:
+        """
+        :param embed_fn: Function embedding a list of texts in a single API call.
+        :param model: Embedding model name, part of the cache key.
+        :param path: SQLite file used as the persistent tier.
+        :param max_memory_items: Size of the in-memory LRU.
+        :param max_batch_size: Maximum number of texts sent in one API call.
+        :param max_wait: Seconds to wait for more texts before sending a batch.
+        """
+        self.embed_fn = embed_fn
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.store = PersistentCache(
+            path,
+            table="embeddings",
+            max_memory_items=max_memory_items,
+            dumps=_dumps_embedding,
+            loads=_loads_embedding,
+        )
+
+        self._lock = threading.Lock()
+        self._pending: Dict[str, str] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._timer = None
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\n{text}".encode("utf-8")).hexdigest()
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        """
+        Schedule the embedding of `texts`.
+
+        :param texts: Texts to embed.
+        :return: One future per text, resolved with its embedding.
+        """
+        keys = [self.key(text) for text in texts]
+        cached = self.store.get_many(keys)
+
+        futures = []
+        with self._lock:
+            for text, key in zip(texts, keys):
+                if key in cached:
+                    future = Future()
+                    future.set_result(cached[key])
+                elif key in self._inflight:
+                    future = self._inflight[key]
+                else:
+                    future = Future()
+                    self._inflight[key] = future
+                    self._pending[key] = text
+                futures.append(future)
+
+            if self._pending and (self._timer is None or len(self._pending) >= self.max_batch_size):
+                # Flush on a timer thread so async callers never block on the API call
+                if self._timer is not None:
+                    self._timer.cancel()
+                wait = 0 if len(self._pending) >= self.max_batch_size else self.max_wait
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        return futures
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [future.result() for future in self.submit(texts)]
+
+    def flush(self) -> None:
+        """Send every queued text to the embeddings API."""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        items = list(pending.items())
+        for start in range(0, len(items), self.max_batch_size):
+            batch = items[start:start + self.max_batch_size]
+            try:
+                embeddings = self.embed_fn([text for _, text in batch])
+                self.store.set_many({key: embedding for (key, _), embedding in zip(batch, embeddings)})
+                results = [(key, embedding, None) for (key, _), embedding in zip(batch, embeddings)]
+            except Exception as e:
+                print(f"Error in EmbeddingCache.flush: {str(e)}")
+                results = [(key, None, e) for key, _ in batch]
+
+            with self._lock:
+                futures = [(self._inflight.pop(key), embedding, error) for key, embedding, error in results]
+            for future, embedding, error in futures:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(embedding)
+
+
+_embedding_caches: Dict[str, EmbeddingCache] = {}
+_embedding_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(client, model: str = "text-embedding-ada-002") -> EmbeddingCache:
+    """
+    Return the process-wide embedding cache for `model`, creating it on first use.
+
+    :param client: OpenAI client used to compute missing embeddings.
+    :param model: Embedding model name.
+    """
+    with _embedding_caches_lock:
+        if model not in _embedding_caches:
+            def embed_fn(texts: List[str]) -> List[List[float]]:
+                with instrument("openai", "embeddings"):
+                    response = client.embeddings.create(input=texts, model=model)
+                record_tokens(model, response.usage.model_dump() if response.usage else None)
+                return [item.embedding for item in response.data]
+
+            _embedding_caches[model] = EmbeddingCache(embed_fn, model)
+            register_stats(f"embedding_cache_{model}", _embedding_caches[model].store.stats)
+        return _embedding_caches[model]
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.services.metrics import register_stats
+from app.services.persistent_cache import PersistentCache
+
+EXERCISE_SIMILARITY_THRESHOLD = float(os.getenv("EXERCISE_SIMILARITY_THRESHOLD", "0.95"))
+
+# Results that must never be reused for another session
+UNCACHEABLE_SOLUTIONS = {"", "Wolfram Alpha service unavailable", "Unable to parse Wolfram Alpha response"}
+
+
+def normalize_exercise(text: str) -> str:
+    """Lowercase, strip accents and punctuation (math operators are kept), collapse whitespace."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"[^\w\s+\-*/=^().,<>%]", " ", text)
+    return " ".join(text.split())
+
+
+def exercise_numbers(text: str) -> List[str]:
+    """Numbers of the exercise, two exercises with different numbers never match."""
+    return [number.replace(",", ".") for number in re.findall(r"\d+(?:[.,]\d+)?", text)]
+
+
+class ExerciseCache:
+    """
+    Fingerprint cache of the work done for an exercise.
+
+    An exercise matches a cached one when their normalized texts are equal,
+    or when their embeddings have a cosine similarity above `threshold` and
+    they contain exactly the same numbers. Entries hold the Wolfram query
+    and solution and the retrieved lesson documents, so a new session on the
+    same exercise skips those external calls.
+    """
+
+    def __init__(
+        self,
+        path: str = os.getenv("EXERCISE_CACHE_PATH", ".cache/exercises.sqlite3"),
+        threshold: float = EXERCISE_SIMILARITY_THRESHOLD,
+        ttl: float = float(os.getenv("EXERCISE_CACHE_TTL", str(30 * 24 * 3600))),
+        refresh_interval: float = 60,
+    ) -> None:
+        """
+        :param path: SQLite file storing the entries, shared by the workers.
+        :param threshold: Minimum cosine similarity of two matching exercises.
+        :param ttl: Seconds after which an entry expires.
+        :param refresh_interval: Seconds after which entries added by other workers are loaded.
+        """
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.store = PersistentCache(path, table="exercises", ttl=ttl)
+
+        self._keys: List[str] = []
+        self._numbers: List[List[str]] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(normalize_exercise(text).encode("utf-8")).hexdigest()
+
+    def _refresh(self) -> None:
+        entries = [(key, entry) for key, entry in self.store.items().items() if entry.get("embedding")]
+        with self._lock:
+            self._keys = [key for key, _ in entries]
+            self._numbers = [entry["numbers"] for _, entry in entries]
+            if entries:
+                self._matrix = np.asarray([entry["embedding"] for _, entry in entries], dtype=np.float32)
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+            self._refreshed_at = time.time()
+
+    def _nearest(self, embedding: np.ndarray, numbers: List[str]) -> Optional[str]:
+        with self._lock:
+            keys, matrix, all_numbers = self._keys, self._matrix, self._numbers
+        if matrix.size == 0 or matrix.shape[1] != embedding.shape[0]:
+            return None
+        scores = matrix @ embedding
+        for index in np.argsort(-scores):
+            if scores[index] < self.threshold:
+                return None
+            if all_numbers[index] == numbers:
+                return keys[index]
+        return None
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1)
+
+    async def lookup(self, text: str, embed: Callable[[List[str]], Awaitable[List[List[float]]]]) -> Optional[Dict[str, Any]]:
+        """
+        Return the entry of the exercise matching `text`, None if there is none.
+
+        A failing lookup is a miss, the cache never fails the turn.
+
+        :param text: Statement of the exercise.
+        :param embed: Coroutine function embedding a list of texts.
+        """
+        try:
+            return await self._lookup(text, embed)
+        except Exception as e:
+            print(f"Error in exercise cache lookup: {str(e)}")
+            return None
+
+    async def _lookup(self, text: str, embed: Callable[[List[str]], Awaitable[List[List[float]]]]) -> Optional[Dict[str, Any]]:
+        if not text:
+            return None
+        entry = self.store.get(self.key(text))
+        if entry is not None:
+            return entry
+
+        if time.time() - self._refreshed_at >= self.refresh_interval:
+            # Loading and decoding every stored embedding would block the event loop
+            await asyncio.to_thread(self._refresh)
+        if not self._keys:
+            return None
+        embedding = self._normalize((await embed([normalize_exercise(text)]))[0])
+        key = self._nearest(embedding, exercise_numbers(text))
+        if key is None:
+            return None
+        print(f"Exercise cache semantic match for: {text}")
+        return self.store.get(key)
+
+    async def update(self, text: str, embed: Callable[[List[str]], Awaitable[List[List[float]]]], **fields: Any) -> None:
+        """
+        Store `fields` in the entry of the exercise `text`, creating it if needed.
+
+        :param text: Statement of the exercise.
+        :param embed: Coroutine function embedding a list of texts.
+        :param fields: Values to store, e.g. solution, wolfram_query, lesson_docs.
+        """
+        try:
+            await self._update(text, embed, **fields)
+        except Exception as e:
+            print(f"Error in exercise cache update: {str(e)}")
+
+    async def _update(self, text: str, embed: Callable[[List[str]], Awaitable[List[List[float]]]], **fields: Any) -> None:
+        if not text:
+            return
+        key = self.key(text)
+        entry = self.store.get(key)
+        if entry is None:
+            embedding = self._normalize((await embed([normalize_exercise(text)]))[0])
+            entry = {"text": text, "numbers": exercise_numbers(text), "embedding": embedding.tolist()}
+            with self._lock:
+                self._keys = self._keys + [key]
+                self._numbers = self._numbers + [entry["numbers"]]
+                self._matrix = embedding[None, :] if self._matrix.size == 0 else np.vstack([self._matrix, embedding])
+        entry = dict(entry, **fields)
+        self.store.set(key, entry)
+
+
+exercise_cache = ExerciseCache()
+register_stats("exercise_cache", exercise_cache.store.stats)
@@ -0,0 +1,61 @@
+import time
+from typing import Any, Dict, Optional
+
+from app.services.metrics import record_generation
+
+
+class GenerationStats:
+    """Latency and throughput of one streamed LLM generation."""
+
+    def __init__(self, name: str) -> None:
+        """
+        :param name: Name of the generation, e.g. "math_chat" or "math_lesson".
+        """
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.chunks = 0
+        self.output_tokens: Optional[int] = None
+
+    def record(self, chunk: Any) -> None:
+        """Account for one streamed chunk."""
+        if self.first_token_at is None and chunk.content:
+            self.first_token_at = time.perf_counter()
+        if chunk.content:
+            self.chunks += 1
+        # With stream_usage the last chunk carries the exact token count
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage:
+            self.output_tokens = usage.get("output_tokens", self.output_tokens)
+
+    def finish(self) -> "GenerationStats":
+        self.finished_at = time.perf_counter()
+        record_generation(self.name, self.time_to_first_token, self.tokens_per_second)
+        print(f"GENERATION STATS : {self.as_dict()}")
+        return self
+
+    @property
+    def tokens(self) -> int:
+        return self.output_tokens if self.output_tokens is not None else self.chunks
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.first_token_at is None or self.finished_at is None or self.finished_at <= self.first_token_at:
+            return None
+        return self.tokens / (self.finished_at - self.first_token_at)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "time_to_first_token": self.time_to_first_token,
+            "tokens": self.tokens,
+            "tokens_per_second": self.tokens_per_second,
+            "duration": (self.finished_at or time.perf_counter()) - self.started_at,
+        }
@@ -1,21 +1,36 @@
 from langchain.vectorstores import VectorStore
 from langchain.schema import Document
 import requests
+from requests.adapters import HTTPAdapter
+import aiohttp
+import asyncio
 from dotenv import load_dotenv
 from langchain_core.retrievers import BaseRetriever
 from openai import OpenAI
 import os
 from pydantic import BaseModel, Field
 from typing import Optional, Type, Dict, Any
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from local_vector_index import LocalVectorIndex, get_local_index
+from app.services.client_registry import client_registry
+from app.services.metrics import instrument
 
 # Load environment variables
 load_dotenv()
 for key, value in os.environ.items():
     print(f'env available in hosted_vector_store.py : {key}: {value}')
 
+CHROMA_TIMEOUT = float(os.getenv("CHROMA_TIMEOUT", "10"))
+CHROMA_POOL_SIZE = int(os.getenv("CHROMA_POOL_SIZE", "100"))
+CHROMA_LOCAL_INDEX = os.getenv("CHROMA_LOCAL_INDEX", "true").lower() == "true"
+
 
 class ChromaAPI(VectorStore):
-    def __init__(self, base_url=os.environ["CHROMA_DB_URL"], api_key=os.environ["CHROMA_API_KEY"], collection_id=os.environ["CHROMA_COLLECTION_ID_K"]):
+    # Keep-alive connection pools shared by every ChromaAPI instance of the process
+    _http_session: Optional[requests.Session] = None
+    _aio_session: Optional[aiohttp.ClientSession] = None
+
+    def __init__(self, base_url=os.environ["CHROMA_DB_URL"], api_key=os.environ["CHROMA_API_KEY"], collection_id=os.environ["CHROMA_COLLECTION_ID_K"], use_local_index=CHROMA_LOCAL_INDEX):
         self.base_url = base_url
         self.api_key = api_key
         self.collection_id = collection_id
@@ -23,40 +38,114 @@ class ChromaAPI(VectorStore):
             "X-Chroma-Token": self.api_key,
             "Content-Type": "application/json"
         }
-        self.client = OpenAI()
+        self.client = client_registry.openai()
+        # Queries are answered in-process once the mirror is synced, over the network otherwise
+        self.local_index: Optional[LocalVectorIndex] = get_local_index(base_url, api_key, collection_id) if use_local_index else None
 
-    def add_texts(self, texts, embeddings, metadatas=None):
-        url = f"{self.base_url}/collections/{self.collection_id}/add"
-        payload = {
+    def local_search(self, query_embedding, k, filter):
+        if self.local_index is None:
+            return None
+        try:
+            with instrument("chroma_local", "query"):
+                return self.local_index.query(query_embedding, k=k, filter=filter)
+        except Exception as e:
+            print(f"Error in local_search: {str(e)}")
+            return None
+
+    @classmethod
+    def get_http_session(cls) -> requests.Session:
+        if cls._http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CHROMA_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            cls._http_session = session
+        return cls._http_session
+
+    @classmethod
+    def get_aio_session(cls) -> aiohttp.ClientSession:
+        # aiohttp sessions are bound to the event loop they were created in
+        loop = asyncio.get_running_loop()
+        session = cls._aio_session
+        if session is None or session.closed or session._loop is not loop:
+            cls._aio_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=CHROMA_POOL_SIZE, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=CHROMA_TIMEOUT),
+            )
+        return cls._aio_session
+
+    @classmethod
+    async def aclose(cls) -> None:
+        if cls._aio_session is not None and not cls._aio_session.closed:
+            await cls._aio_session.close()
+        cls._aio_session = None
+
+    def _add_payload(self, texts, embeddings, metadatas=None):
+        return {
             "documents": texts,
             "embeddings": embeddings,
             "metadatas": metadatas or [{} for _ in range(len(texts))]
         }
-        response = requests.post(url, json=payload, headers=self.headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Error adding texts: {response.text}")
 
-    def from_texts(self, texts, embeddings, metadatas=None):
-        """Store texts, embeddings, and metadata in the vector store."""
-        self.add_texts(texts, embeddings, metadatas)
-
-    def similarity_search(self, query_embedding, k=1, filter=None):
-        url = f"{self.base_url}/collections/{self.collection_id}/query"
+    def _query_payload(self, query_embedding, k, filter):
         payload = {
             "query_embeddings": [query_embedding],
             "n_results": k
         }
         if filter:
             payload["where"] = filter
-        response = requests.post(url, json=payload, headers=self.headers)
-        if response.status_code == 200:
-            documents = response.json()["documents"]
-            #print(documents)
-            return documents[0]
-        else:
-            raise Exception(f"Error querying: {response.text}")
+        return payload
+
+    def add_texts(self, texts, embeddings, metadatas=None):
+        url = f"{self.base_url}/collections/{self.collection_id}/add"
+        payload = self._add_payload(texts, embeddings, metadatas)
+        with instrument("chroma", "add"):
+            response = self.get_http_session().post(url, json=payload, headers=self.headers, timeout=CHROMA_TIMEOUT)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                raise Exception(f"Error adding texts: {response.text}")
+
+    async def aadd_texts(self, texts, embeddings, metadatas=None):
+        url = f"{self.base_url}/collections/{self.collection_id}/add"
+        payload = self._add_payload(texts, embeddings, metadatas)
+        async with instrument("chroma", "add"), self.get_aio_session().post(url, json=payload, headers=self.headers) as response:
+            if response.status == 200:
+                return await response.json()
+            else:
+                raise Exception(f"Error adding texts: {await response.text()}")
+
+    def from_texts(self, texts, embeddings, metadatas=None):
+        """Store texts, embeddings, and metadata in the vector store."""
+        self.add_texts(texts, embeddings, metadatas)
+
+    def similarity_search(self, query_embedding, k=1, filter=None):
+        documents = self.local_search(query_embedding, k, filter)
+        if documents is not None:
+            return documents
+        url = f"{self.base_url}/collections/{self.collection_id}/query"
+        payload = self._query_payload(query_embedding, k, filter)
+        with instrument("chroma", "query"):
+            response = self.get_http_session().post(url, json=payload, headers=self.headers, timeout=CHROMA_TIMEOUT)
+            if response.status_code == 200:
+                documents = response.json()["documents"]
+                #print(documents)
+                return documents[0]
+            else:
+                raise Exception(f"Error querying: {response.text}")
+
+    async def asimilarity_search(self, query_embedding, k=1, filter=None):
+        documents = self.local_search(query_embedding, k, filter)
+        if documents is not None:
+            return documents
+        url = f"{self.base_url}/collections/{self.collection_id}/query"
+        payload = self._query_payload(query_embedding, k, filter)
+        async with instrument("chroma", "query"), self.get_aio_session().post(url, json=payload, headers=self.headers) as response:
+            if response.status == 200:
+                documents = (await response.json())["documents"]
+                return documents[0]
+            else:
+                raise Exception(f"Error querying: {await response.text()}")
 
     def as_retriever(self, search_kwargs=None, filter=None):
         search_kwargs = search_kwargs or {}
@@ -68,22 +157,30 @@ class ChromaRetriever(BaseRetriever):
     vector_store: ChromaAPI
     k: int = 4
     filter: Optional[dict] = None
-    client: OpenAI = Field(default_factory=lambda: OpenAI())
+    client: OpenAI = Field(default_factory=lambda: client_registry.openai())
+    embedding_cache: Optional[EmbeddingCache] = None
 
     class Config:
         arbitrary_types_allowed = True
 
     def __init__(self, vector_store: ChromaAPI, k: int = 4, filter: Optional[dict] = None, **kwargs: Any):
-        super().__init__(vector_store=vector_store, k=k, filter=filter, client=OpenAI(), **kwargs)
+        client = client_registry.openai()
+        super().__init__(
+            vector_store=vector_store,
+            k=k,
+            filter=filter,
+            client=client,
+            embedding_cache=get_embedding_cache(client, "text-embedding-ada-002"),
+            **kwargs
+        )
 
     def get_embeddings(self, texts):
-        response = self.client.embeddings.create(
-            input=texts,
-            model= "text-embedding-ada-002"
-        )
-        data = response.data
-        embeddings = [item.embedding for item in data]
-        return embeddings
+        # Served from the shared cache; misses are batched with concurrent callers
+        return self.embedding_cache.embed(texts)
+
+    async def aget_embeddings(self, texts):
+        futures = self.embedding_cache.submit(texts)
+        return list(await asyncio.gather(*[asyncio.wrap_future(future) for future in futures]))
 
     def _get_relevant_documents(self, query: str):
         query_embedding = self.get_embeddings([query])[0]
@@ -92,3 +189,11 @@ class ChromaRetriever(BaseRetriever):
             k=self.k,
             filter=self.filter
         )
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager=None):
+        query_embedding = (await self.aget_embeddings([query]))[0]
+        return await self.vector_store.asimilarity_search(
+            query_embedding,
+            k=self.k,
+            filter=self.filter
+        )
@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import random
+import threading
+import unicodedata
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "intent_model.npz"))
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.9"))
+# JSONL file receiving the LLM decisions, used as training data; empty to disable
+INTENT_LOG_PATH = os.getenv("INTENT_LOG_PATH", "")
+
+N_FEATURES = 2 ** 16
+NGRAM_RANGE = (2, 4)
+CONCEPT_PREFIX = "concept:"
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.split())
+
+
+def featurize(text: str, n_features: int = N_FEATURES, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hashed character n-grams of `text`, L2-normalized.
+
+    :return: The indices of the non-zero features and their values.
+    """
+    padded = f" {normalize_text(text)} "
+    counts: Counter = Counter()
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        for start in range(len(padded) - n + 1):
+            counts[zlib.crc32(padded[start:start + n].encode("utf-8")) % n_features] += 1
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    return indices, values / np.linalg.norm(values)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-np.clip(x, -30, 30)))
+
+
+class IntentPrediction:
+    """Decisions of the classifier for one message."""
+
+    def __init__(self, is_math_question: str, is_geometry: bool, math_concepts: List[str], confidence: float) -> None:
+        self.is_math_question = is_math_question
+        self.is_geometry = is_geometry
+        self.math_concepts = math_concepts
+        self.confidence = confidence
+
+
+class IntentClassifier:
+    """
+    Linear model over hashed character n-grams deciding, for a first message,
+    whether it is a math question, whether it is about geometry, and which
+    math concepts it involves (one logistic head per label).
+    """
+
+    def __init__(self, labels: List[str], weights: np.ndarray, bias: np.ndarray, n_features: int = N_FEATURES) -> None:
+        """
+        :param labels: Name of each head: "is_math_question", "is_geometry" and "concept:<name>".
+        :param weights: Weights of the heads, shape (len(labels), n_features).
+        :param bias: Bias of the heads, shape (len(labels),).
+        :param n_features: Size of the hashed feature space.
+        """
+        self.labels = labels
+        self.weights = weights
+        self.bias = bias
+        self.n_features = n_features
+        self._concepts = [index for index, label in enumerate(labels) if label.startswith(CONCEPT_PREFIX)]
+
+    @classmethod
+    def load(cls, path: str = INTENT_MODEL_PATH) -> "IntentClassifier":
+        data = np.load(path, allow_pickle=False)
+        return cls(list(data["labels"]), data["weights"], data["bias"], int(data["n_features"]))
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, labels=np.array(self.labels), weights=self.weights, bias=self.bias, n_features=self.n_features)
+
+    def probabilities(self, text: str) -> np.ndarray:
+        indices, values = featurize(text, self.n_features)
+        return _sigmoid(self.weights[:, indices] @ values + self.bias)
+
+    def predict(self, text: str) -> IntentPrediction:
+        """
+        Classify `text`.
+
+        The confidence is the lowest certainty of the two yes/no decisions and
+        of the most likely concept, so a single uncertain decision sends the
+        message to the LLM.
+        """
+        probabilities = self.probabilities(text)
+        math_probability = probabilities[self.labels.index("is_math_question")]
+        geometry_probability = probabilities[self.labels.index("is_geometry")]
+
+        concepts = [self.labels[index][len(CONCEPT_PREFIX):] for index in self._concepts if probabilities[index] >= 0.5]
+        best_concept = max((probabilities[index] for index in self._concepts), default=0.0)
+        confidence = min(
+            max(math_probability, 1 - math_probability),
+            max(geometry_probability, 1 - geometry_probability),
+            best_concept,
+        )
+        if not concepts:
+            # The prompts use the first concept, the LLM has to name one
+            confidence = 0.0
+
+        return IntentPrediction(
+            is_math_question="yes" if math_probability >= 0.5 else "no",
+            is_geometry=bool(geometry_probability >= 0.5),
+            math_concepts=concepts,
+            confidence=float(confidence),
+        )
+
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """Return the classifier of INTENT_MODEL_PATH, None if no model was trained."""
+    global _classifier, _classifier_loaded
+    with _classifier_lock:
+        if not _classifier_loaded:
+            _classifier_loaded = True
+            if os.path.exists(INTENT_MODEL_PATH):
+                _classifier = IntentClassifier.load(INTENT_MODEL_PATH)
+                print(f"Intent classifier loaded from {INTENT_MODEL_PATH}")
+    return _classifier
+
+
+_log_lock = threading.Lock()
+
+
+def log_intent(text: str, is_math_question: str, is_geometry: bool, math_concepts: List[str]) -> None:
+    """Append a decision of the LLM to INTENT_LOG_PATH, the training data of the classifier."""
+    if not INTENT_LOG_PATH or not text:
+        return
+    record = {"text": text, "is_math_question": is_math_question, "is_geometry": is_geometry, "math_concepts": math_concepts}
+    with _log_lock, open(INTENT_LOG_PATH, "a", encoding="utf-8") as log_file:
+        log_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _targets(record: Dict[str, Any], labels: List[str]) -> np.ndarray:
+    concepts = {normalize_text(concept) for concept in record.get("math_concepts", [])}
+    targets = []
+    for label in labels:
+        if label == "is_math_question":
+            targets.append(float(str(record["is_math_question"]).lower() == "yes"))
+        elif label == "is_geometry":
+            targets.append(float(bool(record["is_geometry"])))
+        else:
+            targets.append(float(normalize_text(label[len(CONCEPT_PREFIX):]) in concepts))
+    return np.asarray(targets, dtype=np.float32)
+
+
+def train(
+    records: List[Dict[str, Any]],
+    min_concept_count: int = 5,
+    epochs: int = 10,
+    learning_rate: float = 0.5,
+    l2: float = 1e-6,
+    n_features: int = N_FEATURES,
+    seed: int = 0,
+) -> IntentClassifier:
+    """
+    Fit the classifier with stochastic gradient descent on the logistic loss.
+
+    :param records: Logged decisions, as written by `log_intent`.
+    :param min_concept_count: Concepts seen fewer times get no head.
+    """
+    # Concepts are matched on their normalized spelling and named after their most frequent one
+    spellings = Counter(concept for record in records for concept in set(record.get("math_concepts", [])))
+    concept_counts: Counter = Counter()
+    names: Dict[str, str] = {}
+    for concept, count in spellings.most_common():
+        concept_counts[normalize_text(concept)] += count
+        names.setdefault(normalize_text(concept), concept)
+    concepts = sorted(names[concept] for concept, count in concept_counts.items() if count >= min_concept_count)
+    labels = ["is_math_question", "is_geometry"] + [CONCEPT_PREFIX + concept for concept in concepts]
+
+    samples = [(featurize(record["text"], n_features), _targets(record, labels)) for record in records]
+    weights = np.zeros((len(labels), n_features), dtype=np.float32)
+    bias = np.zeros(len(labels), dtype=np.float32)
+    rng = random.Random(seed)
+    for epoch in range(epochs):
+        rng.shuffle(samples)
+        rate = learning_rate / (1 + epoch)
+        for (indices, values), targets in samples:
+            error = _sigmoid(weights[:, indices] @ values + bias) - targets
+            weights[:, indices] -= rate * (np.outer(error, values) + l2 * weights[:, indices])
+            bias -= rate * error
+    return IntentClassifier(labels, weights, bias, n_features)
+
+
+def evaluate(classifier: IntentClassifier, records: List[Dict[str, Any]], threshold: float = INTENT_CONFIDENCE_THRESHOLD) -> Dict[str, float]:
+    """Share of messages answered locally at `threshold`, and their accuracy against the LLM decisions."""
+    answered = correct = 0
+    for record in records:
+        prediction = classifier.predict(record["text"])
+        if prediction.confidence < threshold:
+            continue
+        answered += 1
+        correct += (
+            prediction.is_math_question == str(record["is_math_question"]).lower()
+            and prediction.is_geometry == bool(record["is_geometry"])
+        )
+    return {
+        "samples": len(records),
+        "coverage": answered / len(records) if records else 0.0,
+        "accuracy": correct / answered if answered else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the first-turn intent classifier from logged LLM decisions.")
+    parser.add_argument("data", help="JSONL file written with INTENT_LOG_PATH")
+    parser.add_argument("--out", default=INTENT_MODEL_PATH, help="path of the model file")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--min-concept-count", type=int, default=5)
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of the data kept for evaluation")
+    parser.add_argument("--threshold", type=float, default=INTENT_CONFIDENCE_THRESHOLD)
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as data_file:
+        records = [json.loads(line) for line in data_file if line.strip()]
+    random.Random(0).shuffle(records)
+    split = int(len(records) * (1 - args.holdout))
+
+    classifier = train(records[:split], min_concept_count=args.min_concept_count, epochs=args.epochs)
+    print(f"Holdout evaluation: {evaluate(classifier, records[split:], args.threshold)}")
+
+    # The shipped model is trained on all the data
+    classifier = train(records, min_concept_count=args.min_concept_count, epochs=args.epochs)
+    classifier.save(args.out)
+    print(f"Model with {len(classifier.labels)} heads saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+from typing import AsyncGenerator, List, Optional
+
+from app.services.metrics import register_stats
+from app.services.persistent_cache import PersistentCache
+
+LESSON_CACHE_MAX_ENTRIES = int(os.getenv("LESSON_CACHE_MAX_ENTRIES", "5000"))
+LESSON_CACHE_CHUNK_SIZE = 64
+
+
+class LessonCache:
+    """
+    Cache of the lessons generated by MathLesson.
+
+    A lesson is identified by the school level, the set of retrieved lesson
+    documents (hashed by content, the hosted collection does not return ids),
+    the lesson prompt template and the model: when any of them changes, the
+    lesson is generated again. Entries expire after `ttl` seconds and the
+    oldest are evicted beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        path: str = os.getenv("LESSON_CACHE_PATH", ".cache/lessons.sqlite3"),
+        ttl: float = float(os.getenv("LESSON_CACHE_TTL", str(7 * 24 * 3600))),
+        max_entries: int = LESSON_CACHE_MAX_ENTRIES,
+    ) -> None:
+        """
+        :param path: SQLite file storing the lessons, shared by the workers.
+        :param ttl: Seconds after which a lesson is generated again.
+        :param max_entries: Maximum number of lessons kept.
+        """
+        self.max_entries = max_entries
+        self.store = PersistentCache(path, table="lessons", max_memory_items=256, ttl=ttl)
+
+    @staticmethod
+    def key(school_level: str, documents: List[str], prompt: str, model: str) -> str:
+        """
+        :param school_level: School level the documents were retrieved for.
+        :param documents: Contents of the retrieved documents.
+        :param prompt: Template of the lesson prompt, so editing it invalidates the lessons.
+        :param model: Name of the model generating the lesson.
+        """
+        document_hashes = sorted(hashlib.sha256(document.encode("utf-8")).hexdigest() for document in documents)
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        identity = json.dumps([school_level, document_hashes, prompt_hash, model])
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.store.get(key)
+        return entry["lesson"] if entry is not None else None
+
+    def set(self, key: str, school_level: str, lesson: str) -> None:
+        self.store.set(key, {"school_level": school_level, "lesson": lesson})
+        self.store.trim(self.max_entries)
+
+    def invalidate(self, school_level: Optional[str] = None) -> int:
+        """
+        Remove the cached lessons of `school_level`, or every lesson if it is None.
+
+        :return: Number of lessons removed.
+        """
+        if school_level is None:
+            removed = len(self.store.items())
+            self.store.clear()
+            return removed
+        keys = [key for key, entry in self.store.items().items() if entry["school_level"] == school_level]
+        for key in keys:
+            self.store.delete(key)
+        return len(keys)
+
+    @staticmethod
+    async def stream(lesson: str) -> AsyncGenerator[str, None]:
+        """Stream a cached lesson in chunks, without waiting between them."""
+        for start in range(0, len(lesson), LESSON_CACHE_CHUNK_SIZE):
+            yield lesson[start:start + LESSON_CACHE_CHUNK_SIZE]
+
+
+lesson_cache = LessonCache()
+register_stats("lesson_cache", lesson_cache.store.stats)
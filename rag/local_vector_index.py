@@ -0,0 +1,242 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import requests
+
+from app.services.metrics import instrument
+
+
+class LocalVectorIndex:
+    """
+    In-process mirror of a hosted Chroma collection.
+
+    The collection is snapshotted into a normalized float32 matrix plus a
+    metadata array, and top-k cosine queries are answered with a single
+    matrix-vector product. The snapshot is refreshed incrementally in a
+    background thread: only ids that appeared since the last sync are
+    downloaded, and ids removed from the hosted collection are dropped.
+    Records edited under an existing id are picked up by a full resnapshot
+    every `full_sync_interval`. A failed sync is retried after
+    `retry_interval` rather than on every query.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        collection_id: str,
+        sync_interval: float = float(os.getenv("CHROMA_LOCAL_SYNC_INTERVAL", "600")),
+        full_sync_interval: float = float(os.getenv("CHROMA_LOCAL_FULL_SYNC_INTERVAL", "21600")),
+        retry_interval: float = float(os.getenv("CHROMA_LOCAL_RETRY_INTERVAL", "60")),
+        page_size: int = 500,
+        timeout: float = 30,
+    ) -> None:
+        """
+        :param base_url: Chroma REST API base url.
+        :param api_key: Chroma token.
+        :param collection_id: Collection to mirror.
+        :param sync_interval: Seconds after which the snapshot is refreshed.
+        :param full_sync_interval: Seconds after which every record is downloaded again.
+        :param retry_interval: Seconds to wait before retrying a failed sync.
+        :param page_size: Number of records fetched per request during sync.
+        :param timeout: Timeout in seconds of each sync request.
+        """
+        self.base_url = base_url
+        self.collection_id = collection_id
+        self.sync_interval = sync_interval
+        self.full_sync_interval = full_sync_interval
+        self.retry_interval = retry_interval
+        self.page_size = page_size
+        self.timeout = timeout
+        self.headers = {
+            "X-Chroma-Token": api_key,
+            "Content-Type": "application/json"
+        }
+        self.http = requests.Session()
+
+        # (ids, matrix, documents, metadatas, filter masks), swapped atomically on sync
+        self._snapshot = ([], np.zeros((0, 0), dtype=np.float32), np.empty(0, dtype=object), np.empty(0, dtype=object), {})
+        self.last_sync = 0.0
+        self.last_full_sync = 0.0
+        self._failed_at = 0.0
+
+        self._sync_lock = threading.Lock()
+        # Guards the check and start of a background sync
+        self._state_lock = threading.Lock()
+        self._syncing = False
+
+    @property
+    def ready(self) -> bool:
+        return self.last_sync > 0
+
+    def _get(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"{self.base_url}/collections/{self.collection_id}/get"
+        with instrument("chroma", "get"):
+            response = self.http.post(url, json=payload, headers=self.headers, timeout=self.timeout)
+        if response.status_code != 200:
+            raise Exception(f"Error fetching collection: {response.text}")
+        return response.json()
+
+    def _fetch_ids(self) -> List[str]:
+        ids = []
+        offset = 0
+        while True:
+            page = self._get({"include": [], "limit": self.page_size, "offset": offset})["ids"]
+            ids.extend(page)
+            if len(page) < self.page_size:
+                return ids
+            offset += self.page_size
+
+    def _fetch_records(self, ids: List[str]) -> Dict[str, List[Any]]:
+        records = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+        for start in range(0, len(ids), self.page_size):
+            page = self._get({
+                "ids": ids[start:start + self.page_size],
+                "include": ["embeddings", "documents", "metadatas"]
+            })
+            for key in records:
+                records[key].extend(page[key])
+        return records
+
+    def sync(self, full: bool = False) -> None:
+        """
+        Bring the local snapshot up to date with the hosted collection.
+
+        :param full: Download every record again instead of only the new ids,
+            so records edited in place are refreshed.
+        """
+        with self._sync_lock:
+            ids, matrix, documents, metadatas, _ = self._snapshot
+            if full:
+                ids, matrix = [], np.zeros((0, 0), dtype=np.float32)
+                documents, metadatas = np.empty(0, dtype=object), np.empty(0, dtype=object)
+            remote_ids = self._fetch_ids()
+            remote_set = set(remote_ids)
+            known = set(ids)
+            new_ids = [id_ for id_ in remote_ids if id_ not in known]
+
+            keep = np.array([id_ in remote_set for id_ in ids], dtype=bool)
+            if len(ids):
+                matrix, documents, metadatas = matrix[keep], documents[keep], metadatas[keep]
+            ids = [id_ for id_, kept in zip(ids, keep) if kept]
+
+            if new_ids:
+                records = self._fetch_records(new_ids)
+                embeddings = np.asarray(records["embeddings"], dtype=np.float32)
+                norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+                embeddings /= np.where(norms == 0, 1, norms)
+
+                new_documents = np.empty(len(records["ids"]), dtype=object)
+                new_documents[:] = records["documents"]
+                new_metadatas = np.empty(len(records["ids"]), dtype=object)
+                new_metadatas[:] = [metadata or {} for metadata in records["metadatas"]]
+
+                ids = ids + records["ids"]
+                matrix = embeddings if matrix.size == 0 else np.vstack([matrix, embeddings])
+                documents = np.concatenate([documents, new_documents])
+                metadatas = np.concatenate([metadatas, new_metadatas])
+
+            self._snapshot = (ids, matrix, documents, metadatas, {})
+            self.last_sync = time.time()
+            if full:
+                self.last_full_sync = self.last_sync
+            print(f"LocalVectorIndex synced {len(ids)} records ({len(new_ids)} {'fetched' if full else 'new'})")
+
+    def _background_sync(self, full: bool) -> None:
+        try:
+            self.sync(full)
+        except Exception as e:
+            self._failed_at = time.time()
+            print(f"Error in LocalVectorIndex.sync: {str(e)}")
+        finally:
+            with self._state_lock:
+                self._syncing = False
+
+    def maybe_sync(self) -> None:
+        """Start a background sync if the snapshot is older than `sync_interval`."""
+        now = time.time()
+        with self._state_lock:
+            if self._syncing or now - self.last_sync < self.sync_interval or now - self._failed_at < self.retry_interval:
+                return
+            self._syncing = True
+        full = now - self.last_full_sync >= self.full_sync_interval
+        threading.Thread(target=self._background_sync, args=(full,), daemon=True).start()
+
+    @staticmethod
+    def _matches(metadata: Dict[str, Any], filter: Dict[str, Any]) -> Optional[bool]:
+        """Evaluate a Chroma `where` filter, None if the filter is not supported."""
+        result = True
+        for key, condition in filter.items():
+            if key == "$and":
+                matches = [LocalVectorIndex._matches(metadata, sub) for sub in condition]
+                if None in matches:
+                    return None
+                result = result and all(matches)
+            elif key.startswith("$"):
+                return None
+            elif isinstance(condition, dict):
+                if set(condition) != {"$eq"}:
+                    return None
+                result = result and metadata.get(key) == condition["$eq"]
+            else:
+                result = result and metadata.get(key) == condition
+        return result
+
+    def _mask(self, metadatas: np.ndarray, masks: Dict[str, np.ndarray], filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not filter:
+            return np.ones(len(metadatas), dtype=bool)
+        cache_key = json.dumps(filter, sort_keys=True)
+        if cache_key not in masks:
+            matches = [self._matches(metadata, filter) for metadata in metadatas]
+            if None in matches:
+                return None
+            masks[cache_key] = np.array(matches, dtype=bool)
+        return masks[cache_key]
+
+    def query(self, query_embedding: List[float], k: int = 1, filter: Optional[Dict[str, Any]] = None) -> Optional[List[str]]:
+        """
+        Return the documents of the `k` nearest records.
+
+        :param query_embedding: Embedding of the query.
+        :param k: Number of documents to return.
+        :param filter: Chroma `where` filter (equality and `$and` only).
+        :return: Documents ordered by similarity, or None when the index cannot answer.
+        """
+        self.maybe_sync()
+        _, matrix, documents, metadatas, masks = self._snapshot
+        if not self.ready or matrix.size == 0:
+            return None
+        mask = self._mask(metadatas, masks, filter)
+        if mask is None:
+            return None
+
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        scores = matrix[candidates] @ query
+
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return documents[candidates[top]].tolist()
+
+
+_local_indexes: Dict[tuple, LocalVectorIndex] = {}
+_local_indexes_lock = threading.Lock()
+
+
+def get_local_index(base_url: str, api_key: str, collection_id: str) -> LocalVectorIndex:
+    """Return the process-wide mirror of a collection, starting its first sync."""
+    with _local_indexes_lock:
+        key = (base_url, collection_id)
+        if key not in _local_indexes:
+            index = LocalVectorIndex(base_url, api_key, collection_id)
+            index.maybe_sync()
+            _local_indexes[key] = index
+        return _local_indexes[key]
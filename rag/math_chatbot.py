@@ -1,6 +1,5 @@
-import aiohttp
+import asyncio
 import json
-import yaml
 from typing import Dict, Any, Union, AsyncGenerator
 from hosted_vector_store import ChromaAPI
 from wolfram_query import WolframQuery
@@ -9,6 +8,12 @@ from langchain_core.messages import SystemMessage, HumanMessage
 from open_ai_client import OpenAILLMModel
 from config.argentic_rag_model import MathState as State
 from langchain_core.prompts import PromptTemplate
+from generation_stats import GenerationStats
+from message_history import build_message_history
+from pipeline import Pipeline
+from multimodal_client import MultimodalClient
+from exercise_cache import exercise_cache, UNCACHEABLE_SOLUTIONS
+from app.services.prompt_registry import prompt_registry, CONTEXTUALIZE_PROMPTS_PATH
 import os
 
 from dotenv import load_dotenv
@@ -23,24 +28,20 @@ class Chatbot(OpenAILLMModel):
 
         self.vector_store = ChromaAPI()
         self.retriever = self.vector_store.as_retriever(filter={"school_level" : "6e"}) #modifier le niveau pour le récupérer depuis le profil utilisateur
-        self.multimodal_api_url = "http://localhost:8001/api/multimodal"
-        #self.multimodal_api_url = os.environ["MULTIMODAL_URL"]
-        with open('rag/config/contextualize_prompts.yaml', 'r') as file:
-            self.prompts = yaml.safe_load(file)
+        self.multimodal = MultimodalClient(os.getenv("MULTIMODAL_API_URL", "http://localhost:8001/api/multimodal"))
+        self.query_wolfram = WolframQuery()
 
 
     def build_message_history(self, state) -> str:
 
-        return "\n".join([f"{message.type}: {message.content}" for message in state["messages"]])
+        return build_message_history(state["messages"])
 
     async def get_solution_from_wolfram(self, state):
-        query_wolfram = WolframQuery()
-        state = await query_wolfram.wolfram_solution(state)
+        state = await self.query_wolfram.wolfram_solution(state)
         return state
 
     async def get_intermediate_solution_from_wolfram(self, state):
-        query_wolfram = WolframQuery()
-        state = await query_wolfram.wolfram_query_intermediate(state)
+        state = await self.query_wolfram.wolfram_query_intermediate(state)
         return state
 
     def build_prompt_intermediate_results(self, state):
@@ -57,19 +58,62 @@ class Chatbot(OpenAILLMModel):
         return start_prompt
 
 
+    def solution_query(self, state, lookup):
+        async def run(results):
+            # The query is generated while the cache is looked up, a miss costs no extra latency
+            query = asyncio.create_task(self.query_wolfram.wolfram_query(state))
+            cached = await lookup
+            if cached and cached.get("wolfram_query"):
+                query.cancel()
+                return cached["wolfram_query"]
+            return await query
+        return run
+
+    def solution(self, state):
+        async def run(results):
+            cached = results["exercise_cache"]
+            if cached and cached.get("solution"):
+                state["wolfram_query"] = results["solution_query"]
+                state["solution"] = cached["solution"]
+                return state
+            await self.query_wolfram.wolfram_solution(state, query=results["solution_query"])
+            if state["solution"] not in UNCACHEABLE_SOLUTIONS:
+                await exercise_cache.update(
+                    state["first_user_message"],
+                    self.retriever.aget_embeddings,
+                    wolfram_query=state["wolfram_query"],
+                    solution=state["solution"]
+                )
+            return state
+        return run
+
     async def build_exercice_prompt(self, state):
+        query_wolfram = self.query_wolfram
+
+        # The solution of the exercice and the intermediate calculations are independent,
+        # each chain starts right away and only the prompt formatting waits for both
+        pipeline = Pipeline("exercice_prompt")
 
         #if we did not store the result of the exercice, need to find a way to clear this value for new exercices
         if "solution" not in state or state["solution"] == "":
-            state = await self.get_solution_from_wolfram(state)
+            # A previous session on the same exercise already paid for the Wolfram calls
+            lookup = asyncio.ensure_future(exercise_cache.lookup(state["first_user_message"], self.retriever.aget_embeddings))
+            pipeline.add("exercise_cache", lambda _: lookup)
+            pipeline.add("solution_query", self.solution_query(state, lookup))
+            pipeline.add("solution", self.solution(state), depends_on=["exercise_cache", "solution_query"])
 
         if len(state["messages"]) >= 2:
-            state = await self.get_intermediate_solution_from_wolfram(state)
+            pipeline.add("intermediate_queries", lambda _: query_wolfram.intermediate_queries(state))
+            pipeline.add(
+                "intermediate_solutions",
+                lambda _: query_wolfram.intermediate_solutions(state),
+                depends_on=["intermediate_queries"]
+            )
 
-        prompt_template = PromptTemplate(
-            input_variables=self.prompts["system_messages"]["exercice_placeholder"],
-            template=self.prompts["system_messages"]["exercice_resolution"]
-        )
+        await pipeline.run()
+        state["pipeline_timings"] = pipeline.timings
+
+        prompt_template = prompt_registry.get_template(CONTEXTUALIZE_PROMPTS_PATH, "exercice_resolution", "exercice_placeholder")
         return prompt_template.format(
             chat_history=self.build_message_history(state),
             solution=state["solution"],
@@ -78,29 +122,10 @@ class Chatbot(OpenAILLMModel):
         )
 
     async def process_image(self, image_data: Dict[str, Any]) -> str:
-        async with aiohttp.ClientSession() as session:
-            data = aiohttp.FormData()
-
-            # Use the image content directly
-            data.add_field('image',
-                           image_data['content'],
-                           filename=image_data['filename'],
-                           content_type=image_data['content_type'])
-
-            try:
-                async with session.post(self.multimodal_api_url, data=data, ssl=False) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"Error from multimodal API: Status {response.status}, {error_text}")
-            except aiohttp.ClientConnectorError as e:
-                raise Exception(f"Unable to connect to multimodal API: {str(e)}")
-            except Exception as e:
-                raise
+        return await self.multimodal.explain(image_data)
 
     async def generate_response(self, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        stats = GenerationStats("math_chat")
         last_message = state["messages"][-1]
         if isinstance(last_message.content, str):
             try:
@@ -118,13 +143,15 @@ class Chatbot(OpenAILLMModel):
 
         prompt = await self.build_exercice_prompt(state)
         print(f"PROMPT : {prompt}")
-        response_generator = self.llm.stream(prompt)
+        response_generator = self.llm.astream(prompt)
 
         accumulated_response = ""
-        for chunk in response_generator:  # Synchronous iteration
+        async for chunk in response_generator:
+            stats.record(chunk)
             chunk_str = str(chunk.content)  # Convert chunk to string
             accumulated_response += chunk_str
             yield chunk_str  # Yield each chunk as it is received
+        state["generation_stats"] = stats.finish().as_dict()
         new_message = SystemMessage(content=accumulated_response)
         state["messages"].append(new_message)
         state["end_conversation"] = True
@@ -140,7 +167,7 @@ class Chatbot(OpenAILLMModel):
             image_content = json.dumps({
                 'image': user_input['image']['filename'],
                 'extracted_text': user_input['extracted_text'],
-                'image_description': image_reasoning["response"]
+                'image_description': image_reasoning
             })
             state["messages"].append(HumanMessage(content=image_content))
 
@@ -1,13 +1,17 @@
 import aiohttp
 import json
-import yaml
-from typing import Dict, Any, Union, AsyncGenerator
+from typing import Dict, Any, List, Union, AsyncGenerator
 from hosted_vector_store import ChromaAPI
 from prompt_builder import PromptBuilder
 from langchain_core.messages import SystemMessage, HumanMessage
 from open_ai_client import OpenAILLMModel
 from config.argentic_rag_model import MathState as State
 from langchain_core.prompts import PromptTemplate
+from generation_stats import GenerationStats
+from message_history import build_message_history
+from exercise_cache import exercise_cache
+from lesson_cache import lesson_cache
+from app.services.prompt_registry import prompt_registry, CONTEXTUALIZE_PROMPTS_PATH
 import os
 
 #from dotenv import load_dotenv
@@ -19,17 +23,13 @@ class MathLesson(OpenAILLMModel):
 
     def __init__(self, model_name: str = "gpt-4o") -> None:
         super().__init__(model_name)
+        self.model_name = model_name
 
         self.vector_store = ChromaAPI()
         self.retriever = self.vector_store.as_retriever(filter={"school_level" : "6e"}) #modifier le niveau pour le récupérer depuis le profil utilisateur
-        with open('rag/config/contextualize_prompts.yaml', 'r') as file:
-            self.prompts = yaml.safe_load(file)
 
     def build_lesson_prompt(self, state):
-        prompt_template = PromptTemplate(
-            input_variables=self.prompts["system_messages"]["lesson_placeholder"],
-            template=self.prompts["system_messages"]["lesson"]
-        )
+        prompt_template = prompt_registry.get_template(CONTEXTUALIZE_PROMPTS_PATH, "lesson", "lesson_placeholder")
 
         # Use the first user message in the session as the exercise
         #exercise = state["first_user_message"]
@@ -42,12 +42,29 @@ class MathLesson(OpenAILLMModel):
         )
     def build_message_history(self, state) -> str:
 
-            return "\n".join([f"{message.type}: {message.content}" for message in state["messages"]])
+            return build_message_history(state["messages"])
 
-    async def generate_lesson(self, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+    async def retrieve_lesson(self, state) -> List[str]:
+        # Lessons retrieved for the same exercise in a previous session are reused
+        exercise = state.get("first_user_message", "")
+        cached = await exercise_cache.lookup(exercise, self.retriever.aget_embeddings)
+        if cached and cached.get("lesson_docs"):
+            return cached["lesson_docs"]
 
         #ici la requête du doc retriever se fait avec le premier message uniquement, à modifier
-        docs = self.retriever.invoke(self.build_message_history(state))
+        docs = await self.retriever.ainvoke(self.build_message_history(state))
+        if docs:
+            await exercise_cache.update(
+                exercise,
+                self.retriever.aget_embeddings,
+                lesson_docs=list(docs)
+            )
+        return docs
+
+    async def generate_lesson(self, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        stats = GenerationStats("math_lesson")
+
+        docs = await self.retrieve_lesson(state)
 
         # docs = self.retriever.invoke("""
         #     Cet exercice concerne le concept des **aires**.
@@ -56,15 +73,30 @@ class MathLesson(OpenAILLMModel):
 
         state["lesson_example"] = docs
 
+        # The same retrieved documents give the same lesson, it is only generated once
+        school_level = (self.retriever.filter or {}).get("school_level", "")
+        prompt_template = prompt_registry.get_template(CONTEXTUALIZE_PROMPTS_PATH, "lesson", "lesson_placeholder")
+        cache_key = lesson_cache.key(school_level, docs, prompt_template.template, self.model_name)
+        cached_lesson = lesson_cache.get(cache_key)
+        if cached_lesson is not None:
+            async for chunk in lesson_cache.stream(cached_lesson):
+                yield chunk
+            return
+
         prompt = self.build_lesson_prompt(state)
         #print(f"prompt : {prompt}")
-        response_generator = self.llm.stream(prompt)
+        response_generator = self.llm.astream(prompt)
 
         accumulated_response = ""
-        for chunk in response_generator:
+        async for chunk in response_generator:
+            stats.record(chunk)
             chunk_str = str(chunk.content)
             accumulated_response += chunk_str
             yield chunk_str
+        stats.finish()
+        # Only lessons streamed to the end are cached
+        if accumulated_response:
+            lesson_cache.set(cache_key, school_level, accumulated_response)
         print(f"LLM RESPONSE LESSON  : {accumulated_response}")
         new_message = SystemMessage(content=accumulated_response)
         # if "lesson" not in state:
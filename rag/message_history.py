@@ -0,0 +1,143 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import tiktoken
+from langchain_core.messages import BaseMessage
+
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "6000"))
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        # Loaded on first use, the encoding file may have to be downloaded
+        _encoding = tiktoken.encoding_for_model("gpt-4o")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(_get_encoding().encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Return the beginning of `text` fitting in `max_tokens` tokens."""
+    encoding = _get_encoding()
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max(max_tokens, 0)])
+
+
+class MessageHistory:
+    """
+    Rendered chat history of a list of messages, kept up to date incrementally.
+
+    Each message is rendered as "type: content" and tokenized once, when it
+    is first seen. Appending a message only renders the new one; replacing
+    a message re-renders from that position.
+    """
+
+    def __init__(self, messages: List[BaseMessage]) -> None:
+        """
+        :param messages: The message list of a chat state, tracked by reference.
+        """
+        self.messages = messages
+        self._seen: List[BaseMessage] = []
+        self._lines: List[str] = []
+        self._tokens: List[int] = []
+        self._total = 0
+        self._text: Optional[str] = None
+
+    def sync(self) -> "MessageHistory":
+        """Render the messages appended or replaced since the last call."""
+        messages = self.messages
+        seen = len(self._seen)
+        # Identity checks are cheap next to tokenizing, the whole prefix is compared so
+        # a message replaced anywhere is re-rendered along with the ones after it
+        start = 0
+        limit = min(len(messages), seen)
+        while start < limit and messages[start] is self._seen[start]:
+            start += 1
+
+        if start == len(messages) == seen:
+            return self
+
+        self._total -= sum(self._tokens[start:])
+        del self._seen[start:], self._lines[start:], self._tokens[start:]
+        for message in messages[start:]:
+            line = f"{message.type}: {message.content}"
+            # The newline joining two messages is counted with the message
+            tokens = count_tokens(line) + 1
+            self._seen.append(message)
+            self._lines.append(line)
+            self._tokens.append(tokens)
+            self._total += tokens
+        self._text = None
+        return self
+
+    @property
+    def token_count(self) -> int:
+        return self.sync()._total
+
+    def render(self, max_tokens: Optional[int] = None) -> str:
+        """
+        Return the history as text.
+
+        :param max_tokens: Token budget; only the most recent messages fitting in it are kept,
+            and at least the last message, truncated if it alone exceeds the budget.
+        :return: One line per message, oldest first.
+        """
+        self.sync()
+        if max_tokens is None or self._total <= max_tokens:
+            if self._text is None:
+                self._text = "\n".join(self._lines)
+            return self._text
+
+        start = len(self._lines)
+        budget = max_tokens
+        while start > 0 and self._tokens[start - 1] <= budget:
+            budget -= self._tokens[start - 1]
+            start -= 1
+        if start == len(self._lines):
+            # The current message is never dropped from the prompt
+            return truncate_tokens(self._lines[-1], max_tokens)
+        return "\n".join(self._lines[start:])
+
+
+_histories: "OrderedDict[int, MessageHistory]" = OrderedDict()
+_histories_lock = threading.Lock()
+_MAX_HISTORIES = 1024
+
+
+def get_history(messages: List[BaseMessage]) -> MessageHistory:
+    """
+    Return the MessageHistory tracking `messages`, creating it on first use.
+
+    Histories are kept for the most recently used message lists, so every
+    call made during a turn, and following turns of an in-memory session,
+    reuse the rendering already done.
+    """
+    with _histories_lock:
+        history = _histories.get(id(messages))
+        # The history holds a reference to its list, so the id cannot be reused while cached
+        if history is None or history.messages is not messages:
+            history = MessageHistory(messages)
+            _histories[id(messages)] = history
+        _histories.move_to_end(id(messages))
+        while len(_histories) > _MAX_HISTORIES:
+            _histories.popitem(last=False)
+    return history.sync()
+
+
+def build_message_history(messages: List[BaseMessage], max_tokens: Optional[int] = HISTORY_MAX_TOKENS) -> str:
+    """
+    Render `messages` within a token budget.
+
+    :param messages: Messages of the chat state.
+    :param max_tokens: Token budget, HISTORY_MAX_TOKENS by default, None for no limit.
+    """
+    return get_history(messages).render(max_tokens)
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+# "inprocess" calls the vision model from this process, "http" posts the image to the multimodal service
+MULTIMODAL_MODE = os.getenv("MULTIMODAL_MODE", "http")
+MULTIMODAL_TIMEOUT = float(os.getenv("MULTIMODAL_TIMEOUT", "90"))
+MULTIMODAL_CONNECT_TIMEOUT = float(os.getenv("MULTIMODAL_CONNECT_TIMEOUT", "5"))
+MULTIMODAL_POOL_SIZE = int(os.getenv("MULTIMODAL_POOL_SIZE", "100"))
+
+
+class MultimodalClient:
+    """
+    Explanation of an image by the vision model, in-process or through the multimodal service.
+
+    In-process, the image bytes go straight to MultimodalOpenAI. Over HTTP,
+    every instance of the process shares one keep-alive aiohttp session.
+    """
+
+    _aio_session: Optional[aiohttp.ClientSession] = None
+    _multimodal = None
+
+    def __init__(self, url: str, mode: str = MULTIMODAL_MODE) -> None:
+        """
+        :param url: URL of the /api/multimodal endpoint, used in "http" mode.
+        :param mode: "inprocess" or "http".
+        """
+        self.url = url
+        self.mode = mode
+
+    @classmethod
+    def get_multimodal(cls):
+        if cls._multimodal is None:
+            # Imported on first use, the http mode does not need the vision model
+            from multimodal_model import MultimodalOpenAI
+
+            cls._multimodal = MultimodalOpenAI()
+        return cls._multimodal
+
+    @classmethod
+    def get_aio_session(cls) -> aiohttp.ClientSession:
+        # aiohttp sessions are bound to the event loop they were created in
+        loop = asyncio.get_running_loop()
+        session = cls._aio_session
+        if session is None or session.closed or session._loop is not loop:
+            cls._aio_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=MULTIMODAL_POOL_SIZE, keepalive_timeout=60, ssl=False),
+                timeout=aiohttp.ClientTimeout(total=MULTIMODAL_TIMEOUT, connect=MULTIMODAL_CONNECT_TIMEOUT),
+            )
+        return cls._aio_session
+
+    @classmethod
+    async def aclose(cls) -> None:
+        if cls._aio_session is not None and not cls._aio_session.closed:
+            await cls._aio_session.close()
+        cls._aio_session = None
+
+    async def explain(self, image_data: Dict[str, Any]) -> str:
+        """
+        Return the explanation of an uploaded image.
+
+        :param image_data: The image, with its "content", "filename" and "content_type".
+        """
+        if self.mode == "inprocess":
+            return await self.get_multimodal().astep_explanation(image_data['content'])
+
+        data = aiohttp.FormData()
+        data.add_field('image',
+                       image_data['content'],
+                       filename=image_data['filename'],
+                       content_type=image_data['content_type'])
+        try:
+            async with self.get_aio_session().post(self.url, data=data) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return result['response']
+                error_text = await response.text()
+                raise Exception(f"Error from multimodal API: Status {response.status}, {error_text}")
+        except aiohttp.ClientConnectorError as e:
+            raise Exception(f"Unable to connect to multimodal API: {str(e)}")
+        except asyncio.TimeoutError:
+            raise Exception(f"Multimodal API timed out after {MULTIMODAL_TIMEOUT}s")
@@ -1,4 +1,5 @@
 from langchain_openai import ChatOpenAI
+from app.services.client_registry import client_registry
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -13,4 +14,6 @@ class OpenAILLMModel:
 
         :param model_name: Name of the model to use.
         """
-        self.llm = ChatOpenAI(model=model_name, temperature = 0.1)
+        # Shared by every instance using the same model, on the process-wide connection pool.
+        # stream_usage reports the exact output token count on the last streamed chunk
+        self.llm = client_registry.chat_model(model_name, temperature=0.1, stream_usage=True)
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+from app.services.metrics import record_stage
+
+
+class Pipeline:
+    """
+    Dependency-aware runner of async stages.
+
+    Every stage starts as soon as the stages it depends on are done, so
+    independent stages run concurrently. The duration of each stage is
+    recorded in `timings` and in the toru_pipeline_stage_seconds histogram.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        :param name: Name of the pipeline, used in logs and metrics.
+        """
+        self.name = name
+        self.stages: Dict[str, tuple] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, fn: Callable[[Dict[str, Any]], Awaitable[Any]], depends_on: Iterable[str] = ()) -> "Pipeline":
+        """
+        Add a stage.
+
+        :param name: Name of the stage.
+        :param fn: Coroutine function running the stage, called with the results of its dependencies.
+        :param depends_on: Names of the stages that must be done before this one starts.
+        """
+        depends_on = tuple(depends_on)
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError(f"Unknown stage {dependency} for {name}")
+        self.stages[name] = (fn, depends_on)
+        return self
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run every stage.
+
+        :return: The result of each stage, by stage name.
+        """
+        started_at = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str) -> Any:
+            fn, depends_on = self.stages[name]
+            dependencies = await asyncio.gather(*[tasks[dependency] for dependency in depends_on])
+            stage_started_at = time.perf_counter()
+            try:
+                return await fn(dict(zip(depends_on, dependencies)))
+            finally:
+                self.timings[name] = time.perf_counter() - stage_started_at
+                record_stage(self.name, name, self.timings[name])
+
+        # Stages are added after their dependencies, so every dependency task exists already
+        for name in self.stages:
+            tasks[name] = asyncio.create_task(run_stage(name))
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except Exception:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        finally:
+            self.timings["total"] = time.perf_counter() - started_at
+            record_stage(self.name, "total", self.timings["total"])
+            print(f"PIPELINE {self.name} TIMINGS : {self.timings}")
+        return dict(zip(tasks.keys(), results))
@@ -1,20 +1,19 @@
-import yaml
 from config.argentic_rag_model import State
 from langchain_core.prompts import PromptTemplate
+from message_history import build_message_history
+from app.services.prompt_registry import prompt_registry, CONTEXTUALIZE_PROMPTS_PATH
 
 class PromptBuilder:
 
     def __init__(self, state : State) -> None:
 
-        with open('rag/config/contextualize_prompts.yaml', 'r') as file:
-            self.prompts = yaml.safe_load(file)
         self.state = state
         self.history =  self.build_message_history()
 
 
     def build_message_history(self) -> str:
 
-        return "\n".join([f"{message.type}: {message.content}" for message in self.state["messages"]])
+        return build_message_history(self.state["messages"])
 
     def build_prompt(self) -> PromptTemplate:
 
@@ -41,10 +40,7 @@ class PromptBuilder:
 
     def select_template(self, prompt_key, placeholder_key):
 
-        return PromptTemplate(
-            input_variables=self.prompts["system_messages"][placeholder_key],
-            template=self.prompts["system_messages"][prompt_key]
-        )
+        return prompt_registry.get_template(CONTEXTUALIZE_PROMPTS_PATH, prompt_key, placeholder_key)
 
     def build_concept_prompt(self):
 
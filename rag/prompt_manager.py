@@ -1,20 +1,19 @@
-import yaml
 from typing import Dict, Any
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate, MessagesPlaceholder
+from app.services.prompt_registry import prompt_registry, PROMPTS_CONFIG_PATH
 
 class PromptManager:
     """Manages the creation of prompts from a configuration file."""
 
     @staticmethod
-    def load_config(config_path: str = 'rag/prompts_config.yaml') -> Dict[str, Any]:
+    def load_config(config_path: str = PROMPTS_CONFIG_PATH) -> Dict[str, Any]:
         """
-        Load the prompt configuration from a YAML file.
+        Load the prompt configuration from a YAML file, parsed once by the prompt registry.
 
         :param config_path: Path to the configuration file.
         :return: Dictionary containing the prompt configurations.
         """
-        with open(config_path, 'r') as file:
-            return yaml.safe_load(file)
+        return prompt_registry.load(config_path)
 
     @classmethod
     def create_chat_prompt(cls, prompt_name: str) -> ChatPromptTemplate:
@@ -28,13 +27,16 @@ class PromptManager:
         if prompt_name not in config['chat_prompts']:
             raise ValueError(f"Unknown chat prompt: {prompt_name}")
 
-        prompt_config = config['chat_prompts'][prompt_name]
-        messages = [
-            ("system", prompt_config['system']),
-            MessagesPlaceholder("chat_history"),
-            ("human", prompt_config['human']),
-        ]
-        return ChatPromptTemplate.from_messages(messages)
+        def build(config: Dict[str, Any]) -> ChatPromptTemplate:
+            prompt_config = config['chat_prompts'][prompt_name]
+            messages = [
+                ("system", prompt_config['system']),
+                MessagesPlaceholder("chat_history"),
+                ("human", prompt_config['human']),
+            ]
+            return ChatPromptTemplate.from_messages(messages)
+
+        return prompt_registry.get_compiled(PROMPTS_CONFIG_PATH, ("chat", prompt_name), build)
 
     @classmethod
     def create_template_prompt(cls, prompt_name: str) -> PromptTemplate:
@@ -48,8 +50,11 @@ class PromptManager:
         if prompt_name not in config['template_prompts']:
             raise ValueError(f"Unknown template prompt: {prompt_name}")
 
-        template = config['template_prompts'][prompt_name]
-        return PromptTemplate(template=template)
+        return prompt_registry.get_compiled(
+            PROMPTS_CONFIG_PATH,
+            ("template", prompt_name),
+            lambda config: PromptTemplate.from_template(config['template_prompts'][prompt_name])
+        )
 
     @classmethod
     def create_prompts(cls) -> tuple[ChatPromptTemplate, ChatPromptTemplate, PromptTemplate]:
@@ -6,6 +6,7 @@ import asyncio
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.config import settings
+from app.services.metrics import setup_metrics
 from config.argentic_rag_model import MathState as State
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
@@ -13,7 +14,13 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Response
 from math_chatbot import Chatbot
 from math_lesson import MathLesson
+from hosted_vector_store import ChromaAPI
+from wolfram_query import wolfram_cache
+from lesson_cache import lesson_cache
+from session_store import build_session_store
 from multimodal_model import MultimodalOpenAI
+from multimodal_client import MultimodalClient
+from app.services.vision_explainer import explanation_response
 from typing import Dict, Any, Optional
 from pydantic import BaseModel
 from fastapi.responses import StreamingResponse
@@ -33,10 +40,17 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+setup_metrics(app)
 
-sessions: Dict[str, State] = {}
+sessions = build_session_store()
 chatbot = Chatbot()
 math_lesson = MathLesson()
+multimodal = MultimodalOpenAI()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await ChromaAPI.aclose()
+    await MultimodalClient.aclose()
 
 class ChatInput(BaseModel):
     session_id: str
@@ -44,21 +58,23 @@ class ChatInput(BaseModel):
     image: Optional[UploadFile]
     extracted_text: Optional[str]
 
+def new_state() -> State:
+    return State(
+        messages=[],
+        first_user_message="",
+        end_conversation=False,
+        image_description="",
+        is_geometry=False,
+        lesson_example="",
+        solution="",
+        wolfram_query="",
+        intermediate_solution=[""],
+        intermediate_calculation=[""],
+        intermediate_calculation_explanation=[""]
+    )
+
 def get_or_create_session(session_id: str) -> State:
-    if session_id not in sessions:
-        sessions[session_id] = State(
-            messages=[],
-            first_user_message="",
-            end_conversation=False,
-            image_description="",
-            is_geometry=False,
-            lesson_example="",
-            solution="",
-            intermediate_solution=[""],
-            intermediate_calculation=[""],
-            intermediate_calculation_explanation=[""]
-        )
-    return sessions[session_id]
+    return sessions.get_or_create(session_id, new_state)
 
 
 @app.post("/api/math_lesson")
@@ -74,11 +90,19 @@ async def lesson(
     print(f"Lesson Session: {session}")
 
     async def stream_response():
-        async for chunk in math_lesson.generate_lesson(session):
-            yield chunk
+        try:
+            async for chunk in math_lesson.generate_lesson(session):
+                yield chunk
+        finally:
+            sessions.save(session_id, session)
 
     return StreamingResponse(stream_response(), media_type="text/plain")
 
+@app.delete("/api/math_lesson/cache")
+async def invalidate_lesson_cache(school_level: Optional[str] = None):
+    # After the lesson documents or the prompt are updated, e.g. DELETE /api/math_lesson/cache?school_level=6e
+    return {"removed": lesson_cache.invalidate(school_level)}
+
 @app.post("/api/math_chat")
 async def chat(
     request: Request,
@@ -116,6 +140,8 @@ async def chat(
             except Exception as e:
                 print(f"Error in stream_response: {str(e)}")
                 yield "Je suis désolé, mais je rencontre des difficultés pour traiter votre demande en ce moment. Veuillez réessayer plus tard."
+            finally:
+                sessions.save(session_id, session)
 
         return StreamingResponse(stream_response(), media_type="text/plain")
 
@@ -126,18 +152,7 @@ async def chat(
 @app.post("/new_session")
 async def new_session(response: Response, request: Request):
     session_id = str(uuid4())
-    sessions[session_id] = State(
-        messages=[],
-        first_user_message="",
-        end_conversation=False,
-        image_description="",
-        is_geometry=False,
-        lesson_example="",
-        solution="",
-        intermediate_solution=[""],
-        intermediate_calculation=[""],
-        intermediate_calculation_explanation=[""]
-    )
+    sessions.save(session_id, new_state())
 
     origin = request.headers.get("Origin")
 
@@ -146,20 +161,14 @@ async def new_session(response: Response, request: Request):
 
     return {"session_id": session_id}
 
+@app.get("/api/wolfram_cache/stats")
+async def wolfram_cache_stats():
+    return wolfram_cache.stats()
+
 @app.post("/api/multimodal")
-async def image_comprehension(image: UploadFile = File(...)):
+async def image_comprehension(image: UploadFile = File(...), stream: bool = Form(False)):
     print("Received image comprehension request")
-    multimodal = MultimodalOpenAI()
-    try:
-
-        contents = await image.read()
-
-        response = multimodal.step_explanation(contents)
-        print(response)
-
-        return {"response" : response }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await explanation_response(multimodal, image, stream)
 
 
 if __name__ == "__main__":
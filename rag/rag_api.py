@@ -1,3 +1,9 @@
+import sys
+import os
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from vector_store import OpenAIChromaVectorStore
 from open_ai_client import OpenAILLMModel
 from prompt_manager import PromptManager
@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+
+def serialize_state(state: Dict[str, Any]) -> bytes:
+    """
+    Serialize a chat state to compact bytes (compressed JSON).
+
+    LangChain messages are converted with `messages_to_dict`, every other
+    value must be JSON serializable (anything else is stored as a string).
+    """
+    data = dict(state)
+    data["messages"] = messages_to_dict(state.get("messages", []))
+    return zlib.compress(json.dumps(data, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def deserialize_state(raw: bytes) -> Dict[str, Any]:
+    data = json.loads(zlib.decompress(raw).decode("utf-8"))
+    data["messages"] = messages_from_dict(data.get("messages", []))
+    return data
+
+
+class SessionStore(ABC):
+    """Storage of the chat state of each session."""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the state of `session_id`, None if unknown or expired."""
+
+    @abstractmethod
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Store the state of `session_id`."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Remove the state of `session_id`, if any."""
+
+    def get_or_create(self, session_id: str, factory: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the state of `session_id`, creating and saving it with `factory` if unknown.
+
+        :param session_id: Identifier of the session.
+        :param factory: Function building an empty state.
+        """
+        state = self.get(session_id)
+        if state is None:
+            state = factory()
+            self.save(session_id, state)
+        return state
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store, bounded by a maximum number of sessions and an idle TTL."""
+
+    def __init__(self, max_sessions: int = 10000, ttl: Optional[float] = 24 * 3600) -> None:
+        """
+        :param max_sessions: Least recently used sessions are evicted above this size.
+        :param ttl: Seconds of inactivity after which a session expires, None to never expire.
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            state, last_access = entry
+            if self.ttl is not None and time.time() - last_access > self.ttl:
+                del self._sessions[session_id]
+                return None
+            self._sessions[session_id] = (state, time.time())
+            self._sessions.move_to_end(session_id)
+            return state
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self._sessions[session_id] = (state, time.time())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store shared by every worker process of the host through a SQLite file.
+
+    States are written with `serialize_state`, so a session can be served by
+    any uvicorn worker. Sessions idle for longer than `ttl` are purged.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = 24 * 3600, purge_interval: float = 60) -> None:
+        """
+        :param path: Path of the SQLite file.
+        :param ttl: Seconds of inactivity after which a session expires, None to never expire.
+        :param purge_interval: Minimum number of seconds between two purges of expired sessions.
+        """
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(session_id TEXT PRIMARY KEY, state BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        if self.ttl is not None and time.time() - row[1] > self.ttl:
+            self.delete(session_id)
+            return None
+        return deserialize_state(row[0])
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        raw = serialize_state(state)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, raw, now)
+            )
+            if self.ttl is not None and now - self._last_purge > self.purge_interval:
+                self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+                self._last_purge = now
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+
+def build_session_store() -> SessionStore:
+    """
+    Build the session store selected by the SESSION_STORE environment variable.
+
+    "memory" (default) keeps sessions in the process, "sqlite" shares them
+    between workers through the file at SESSION_STORE_PATH.
+    """
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    ttl = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_STORE_PATH", ".cache/sessions.sqlite3"), ttl=ttl)
+    if backend == "memory":
+        return InMemorySessionStore(max_sessions=int(os.getenv("SESSION_MAX", "10000")), ttl=ttl)
+    raise ValueError(f"Unknown session store: {backend}")
@@ -1,4 +1,3 @@
-import yaml
 from langchain_core.prompts import PromptTemplate
 from langchain_core.messages import AIMessage
 from config.argentic_rag_model import (State,
@@ -8,6 +7,9 @@ from config.argentic_rag_model import (State,
     StudentStateLesson,
     StudentStateResolution)
 from open_ai_client import OpenAILLMModel
+from message_history import build_message_history
+from intent_classifier import get_intent_classifier, log_intent, INTENT_CONFIDENCE_THRESHOLD
+from app.services.prompt_registry import prompt_registry, PROMPTS_PATH
 
 
 class UserAnalysis(OpenAILLMModel):
@@ -20,20 +22,15 @@ class UserAnalysis(OpenAILLMModel):
             model_name (str): The name of the model to use for analysis.
         """
         super().__init__(model_name)
-        with open('rag/config/prompts.yaml', 'r') as file:
-            self.prompts = yaml.safe_load(file)
 
 
     def build_prompt(self, prompt_key):
 
-        return PromptTemplate(
-                    template=self.prompts["system_messages"][prompt_key],
-                    input_variables=["content", "chat_history"]
-                )
+        return prompt_registry.get_template(PROMPTS_PATH, prompt_key, input_variables=["content", "chat_history"])
 
     def build_message_history(self, state: State) -> str:
         """
-        Build the message history from the state.
+        Build the message history from the state, limited to HISTORY_MAX_TOKENS tokens.
 
         Args:
             state (State): The current state of the chat.
@@ -41,27 +38,27 @@ class UserAnalysis(OpenAILLMModel):
         Returns:
             str: The message history.
         """
-        return "\n".join([f"{message.type}: {message.content}" for message in state["messages"]])
+        return build_message_history(state["messages"])
 
-    def user_analysis(self, state: State) -> State:
+    async def user_analysis(self, state: State) -> dict:
         """
-        Perform user analysis and update the state.
+        Perform user analysis.
 
         Args:
             state (State): The current state of the chat.
 
         Returns:
-            State: The updated state with user analysis.
+            dict: The keys of the state updated by the analysis.
         """
 
         if state["response_count"] == 0:
-            return self.user_analysis_intro(state)
+            return await self.user_analysis_intro(state)
         elif not state["introduction"] and ("concept_understood" not in state or state["concept_understood"] == False):
-            return self.user_analysis_concept(state)
+            return await self.user_analysis_concept(state)
         elif state["concept_understood"] and ("lesson_understood" not in state or not state["lesson_understood"]):
-            return self.user_analysis_lesson(state)
+            return await self.user_analysis_lesson(state)
         else:
-            return state
+            return {}
 
         # llm_analysis = self.llm.with_structured_output(StudentState)
         # chain = self.prompt_analysis | llm_analysis
@@ -69,51 +66,62 @@ class UserAnalysis(OpenAILLMModel):
 
         # return self.update_state(state, student_analysis)
 
-    def user_analysis_intro(self, state: State) -> State:
+    async def user_analysis_intro(self, state: State) -> dict:
+
+        # The local classifier answers confident cases without calling the LLM
+        classifier = get_intent_classifier()
+        if classifier is not None:
+            prediction = classifier.predict(state["first_user_message"])
+            if prediction.confidence >= INTENT_CONFIDENCE_THRESHOLD:
+                return {
+                    "math_concepts": prediction.math_concepts,
+                    "is_geometry": prediction.is_geometry,
+                    "is_math_question": prediction.is_math_question,
+                    "introduction": False,
+                }
 
         prompt = self.build_prompt("user_analysis_introduction")
         llm_analysis = self.llm.with_structured_output(StudentStateIntroduction)
         chain = prompt | llm_analysis
-        student_analysis = chain.invoke({"content": state["first_user_message"], "chat_history" : self.build_message_history(state)})
-        state["math_concepts"] = student_analysis.math_concepts
-        state["is_geometry"] = student_analysis.is_geometry
-        state["is_math_question"] = student_analysis.is_math_question
-        state["introduction"] = False
+        student_analysis = await chain.ainvoke({"content": state["first_user_message"], "chat_history" : self.build_message_history(state)})
+        log_intent(state["first_user_message"], student_analysis.is_math_question, student_analysis.is_geometry, student_analysis.math_concepts)
 
-        return state
+        return {
+            "math_concepts": student_analysis.math_concepts,
+            "is_geometry": student_analysis.is_geometry,
+            "is_math_question": student_analysis.is_math_question,
+            "introduction": False,
+        }
 
-    def user_analysis_concept(self, state: State) -> State:
+    async def user_analysis_concept(self, state: State) -> dict:
         #print("START USER ANALYSIS CONCEPT")
         prompt = self.build_prompt("user_analysis_concept")
         llm_analysis = self.llm.with_structured_output(StudentStateConcept)
         chain = prompt | llm_analysis
-        student_analysis = chain.invoke({"content": state["first_user_message"], "chat_history" : self.build_message_history(state)})
+        student_analysis = await chain.ainvoke({"content": state["first_user_message"], "chat_history" : self.build_message_history(state)})
         #print(f"STUDENT ANALYSIS : {student_analysis}")
-        state["concept_understood"] = student_analysis.concept_understood
 
-        return state
+        return {"concept_understood": student_analysis.concept_understood}
 
-    def user_analysis_lesson(self, state: State) -> State:
+    async def user_analysis_lesson(self, state: State) -> dict:
 
         #print("START USER ANALYSIS LESSON")
         prompt = self.build_prompt("user_analysis_lesson")
         llm_analysis = self.llm.with_structured_output(StudentStateLesson)
         chain = prompt | llm_analysis
-        student_analysis = chain.invoke({"content": state["first_user_message"], "chat_history" : self.build_message_history(state)})
-
-        state["need_lesson"] = student_analysis.need_lesson
-        state["lesson_understood"] = student_analysis.lesson_understood
+        student_analysis = await chain.ainvoke({"content": state["first_user_message"], "chat_history" : self.build_message_history(state)})
 
-        return state
+        return {
+            "need_lesson": student_analysis.need_lesson,
+            "lesson_understood": student_analysis.lesson_understood,
+        }
 
-    def user_analysis_resolution(self, state: State) -> State:
+    async def user_analysis_resolution(self, state: State) -> dict:
 
         #print("START USER ANALYSIS RESOLUTION")
         prompt = self.build_prompt("user_analysis_resolution")
         llm_analysis = self.llm.with_structured_output(StudentStateResolution)
         chain = prompt | llm_analysis
-        student_analysis = chain.invoke({"chat_history" : self.build_message_history(state)})
-
-        state["good_answer"] = student_analysis.good_answer
+        student_analysis = await chain.ainvoke({"chat_history" : self.build_message_history(state)})
 
-        return state
+        return {"good_answer": student_analysis.good_answer}
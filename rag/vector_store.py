@@ -1,11 +1,13 @@
 from typing import List, Tuple, Dict, Any
 
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 #from langchain.vectorstores import Chroma
 from langchain_chroma import Chroma
 from langchain_core.retrievers import BaseRetriever
 from dotenv import load_dotenv
 
+from app.services.client_registry import client_registry
+
 # Load environment variables
 load_dotenv()
 
@@ -23,7 +25,8 @@ class OpenAIChromaVectorStore:
 
         self.vectorstore = Chroma(
             persist_directory=persist_directory,
-            embedding_function=OpenAIEmbeddings(model=model),
+            # Pooled connections, and every embedding call is recorded in the metrics
+            embedding_function=client_registry.embeddings(model),
             collection_name=collection_name
         )
 
@@ -1,6 +1,5 @@
 import aiohttp
 import json
-import yaml
 from typing import Dict, Any, Union, AsyncGenerator
 from prompt_builder import PromptBuilder
 from open_ai_client import OpenAILLMModel
@@ -12,27 +11,46 @@ import os
 import asyncio
 import re
 import httpx
+from app.services.persistent_cache import PersistentCache
+from app.services.metrics import instrument, register_stats
+from app.services.single_flight import SingleFlight
+from app.services.prompt_registry import prompt_registry, CONTEXTUALIZE_PROMPTS_PATH
 
 #from dotenv import load_dotenv
 
 # Load environment variables
 #load_dotenv("etc/secrets/.env")
 
+# Shared by every WolframQuery of the process, and across workers through the SQLite file
+wolfram_cache = PersistentCache(
+    os.getenv("WOLFRAM_CACHE_PATH", ".cache/wolfram.sqlite3"),
+    table="wolfram",
+    max_memory_items=int(os.getenv("WOLFRAM_CACHE_MEMORY_ITEMS", "2048")),
+    ttl=float(os.getenv("WOLFRAM_CACHE_TTL", str(30 * 24 * 3600))),
+)
+register_stats("wolfram_cache", wolfram_cache.stats)
+
+# Students of a class starting the same exercise together share one Wolfram call
+wolfram_flight = SingleFlight("wolfram")
+wolfram_query_flight = SingleFlight("wolfram_query")
+register_stats("wolfram_single_flight", wolfram_flight.stats)
+register_stats("wolfram_query_single_flight", wolfram_query_flight.stats)
+
+WOLFRAM_MAX_CONCURRENCY = int(os.getenv("WOLFRAM_MAX_CONCURRENCY", "4"))
+WOLFRAM_QUERY_TIMEOUT = float(os.getenv("WOLFRAM_QUERY_TIMEOUT", "10"))
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
 class WolframQuery(OpenAILLMModel):
 
     def __init__(self, model_name: str = "gpt-4o") -> None:
         super().__init__(model_name)
 
-        with open('rag/config/contextualize_prompts.yaml', 'r') as file:
-            self.prompts = yaml.safe_load(file)
-        self.prompt = self.prompts["system_messages"]["wolfram"]
         self.wolfram = WolframAlphaAPIWrapper()
 
     def build_wolfram_prompt(self, state):
-        prompt_template = PromptTemplate(
-            input_variables=self.prompts["system_messages"]["wolfram_placeholder"],
-            template=self.prompts["system_messages"]["wolfram"]
-        )
+        prompt_template = prompt_registry.get_template(CONTEXTUALIZE_PROMPTS_PATH, "wolfram", "wolfram_placeholder")
 
         # Use the first user message in the session as the exercise
         exercise = state["first_user_message"]
@@ -41,18 +59,38 @@ class WolframQuery(OpenAILLMModel):
             exercice=exercise
         )
 
-    def wolfram_query(self, state):
+    async def wolfram_query(self, state):
 
         prompt = self.build_wolfram_prompt(state)
-        query = self.llm(prompt)
 
-        return query.content
+        async def generate_query():
+            query = await self.llm.ainvoke(prompt)
+            return query.content
 
-    async def wolfram_solution(self, state):
-        query = self.wolfram_query(state)
-        try:
-            # Use asyncio.to_thread to run the synchronous Wolfram Alpha query in a separate thread
+        return await wolfram_query_flight.do(prompt, generate_query)
+
+    async def run_wolfram(self, query: str) -> str:
+        key = normalize_query(query)
+        cached = wolfram_cache.get(key)
+        if cached is not None:
+            return cached
+        return await wolfram_flight.do(key, lambda: self._run_wolfram(query, key), recheck=lambda: wolfram_cache.get(key))
+
+    async def _run_wolfram(self, query: str, key: str) -> str:
+        # Use asyncio.to_thread to run the synchronous Wolfram Alpha query in a separate thread
+        async with instrument("wolfram", "query"):
             response = await asyncio.to_thread(self.wolfram.run, query)
+        # Only answers are cached, "wasn't able to answer" responses are retried next time
+        if "Answer:" in response:
+            wolfram_cache.set(key, response)
+        return response
+
+    async def wolfram_solution(self, state, query=None):
+        if query is None:
+            query = await self.wolfram_query(state)
+        state["wolfram_query"] = query
+        try:
+            response = await asyncio.wait_for(self.run_wolfram(query), timeout=WOLFRAM_QUERY_TIMEOUT)
             match = re.search(r"Answer: (.+)", response)
             try:
                 state["solution"] = match.group(1).replace("x = ","")
@@ -64,31 +102,45 @@ class WolframQuery(OpenAILLMModel):
         return state
 
     async def wolfram_query_intermediate(self, state):
+        state = await self.intermediate_queries(state)
+        return await self.intermediate_solutions(state)
 
-        prompt  = PromptTemplate(
-            input_variables=self.prompts["system_messages"]["wolfram_intermediate_placeholder"],
-            template=self.prompts["system_messages"]["wolfram_intermediate"]
-        )
+    async def intermediate_queries(self, state):
+
+        prompt = prompt_registry.get_template(CONTEXTUALIZE_PROMPTS_PATH, "wolfram_intermediate", "wolfram_intermediate_placeholder")
 
         llm_analysis = self.llm.with_structured_output(WolframIntermediateQuery)
         chain = prompt | llm_analysis
-        query = chain.invoke({"last_message": state["messages"][-2]})
+        query = await chain.ainvoke({"last_message": state["messages"][-2]})
 
         state["intermediate_calculation"] = query.wolfram_queries
         state["intermediate_calculation_explanation"] = query.calculation_explanation
-        list_solution = []
-        for query in state["intermediate_calculation"]:
-            try:
-                response = await asyncio.to_thread(self.wolfram.run, query)
-                match = re.search(r"Answer: (.+)", response)
-                try:
-                    list_solution.append(match.group(1))
-                except:
-                    list_solution.append("Unable to parse Wolfram Alpha response")
-            except (httpx.RemoteProtocolError, Exception) as e:
-                print(f"Error in wolfram_query_intermediate: {str(e)}")
-                list_solution.append("Wolfram Alpha service unavailable")
-
-        state["intermediate_solution"] = list_solution
 
         return state
+
+    async def intermediate_solutions(self, state):
+
+        # Every intermediate calculation is queried concurrently, results keep the query order
+        semaphore = asyncio.Semaphore(WOLFRAM_MAX_CONCURRENCY)
+        state["intermediate_solution"] = list(await asyncio.gather(*[
+            self.intermediate_result(query, semaphore) for query in state["intermediate_calculation"]
+        ]))
+
+        return state
+
+    async def intermediate_result(self, query: str, semaphore: asyncio.Semaphore) -> str:
+        try:
+            async with semaphore:
+                response = await asyncio.wait_for(self.run_wolfram(query), timeout=WOLFRAM_QUERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Timeout in wolfram_query_intermediate for query: {query}")
+            return "Wolfram Alpha service unavailable"
+        except (httpx.RemoteProtocolError, Exception) as e:
+            print(f"Error in wolfram_query_intermediate: {str(e)}")
+            return "Wolfram Alpha service unavailable"
+
+        match = re.search(r"Answer: (.+)", response)
+        try:
+            return match.group(1)
+        except:
+            return "Unable to parse Wolfram Alpha response"
@@ -0,0 +1,153 @@
+"""
+Load test of the /ws/audio Deepgram bridge.
+
+Start the stub Deepgram server, then the app pointed at it, then the clients:
+
+    python scripts/ws_audio_load.py stub --port 8765
+    DEEPGRAM_URL=http://localhost:8765 DEEPGRAM_API_KEY=stub uvicorn app.main:app --port 8000
+    python scripts/ws_audio_load.py run --url ws://localhost:8000/ws/audio --clients 300 --duration 20
+
+The stub answers every audio frame with a transcript echoing the client id
+and send time written at the start of the frame, so each client checks that
+it only receives its own transcripts and measures the round-trip latency.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+import websockets
+
+# 100 ms of 16 kHz mono linear16 audio
+FRAME_BYTES = 3200
+FRAME_INTERVAL = 0.1
+
+
+def results_message(transcript: str, is_final: bool, start: float) -> str:
+    return json.dumps({
+        "type": "Results",
+        "channel_index": [0, 1],
+        "duration": FRAME_INTERVAL,
+        "start": start,
+        "is_final": is_final,
+        "speech_final": is_final,
+        "from_finalize": False,
+        "channel": {
+            "alternatives": [{"transcript": transcript, "confidence": 1.0, "words": []}],
+        },
+        "metadata": {
+            "request_id": "stub",
+            "model_info": {"name": "stub", "version": "0", "arch": "stub"},
+            "model_uuid": "stub",
+        },
+    })
+
+
+async def stub_connection(websocket, final_every: int) -> None:
+    frames = 0
+    try:
+        async for frame in websocket:
+            if isinstance(frame, str):
+                # KeepAlive, Finalize or CloseStream
+                if json.loads(frame).get("type") == "CloseStream":
+                    break
+                continue
+            frames += 1
+            # Frames start with "<client id>|<send time>|"
+            transcript = b"|".join(frame[:64].split(b"|")[:2]).decode("utf-8", "replace")
+            is_final = frames % final_every == 0
+            await websocket.send(results_message(transcript, is_final, frames * FRAME_INTERVAL))
+    except websockets.ConnectionClosed:
+        pass
+
+
+async def run_stub(host: str, port: int, final_every: int) -> None:
+    async with websockets.serve(
+        lambda websocket: stub_connection(websocket, final_every), host, port, max_size=None
+    ):
+        print(f"Stub Deepgram server listening on ws://{host}:{port}")
+        await asyncio.Future()
+
+
+async def run_client(url: str, client_id: int, duration: float, stats: Dict[str, Any]) -> None:
+    prefix = f"client-{client_id}"
+    latencies: List[float] = stats["latencies"]
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=30) as websocket:
+
+            async def receive() -> None:
+                async for message in websocket:
+                    data = json.loads(message)
+                    if data.get("type") != "transcription":
+                        continue
+                    owner, _, sent = data["text"].partition("|")
+                    if owner != prefix:
+                        stats["misrouted"] += 1
+                        continue
+                    stats["received"] += 1
+                    stats["finals"] += bool(data["is_final"])
+                    latencies.append(time.time() - float(sent))
+
+            receiver = asyncio.create_task(receive())
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                header = f"{prefix}|{time.time():.6f}|".encode("utf-8")
+                await websocket.send(header.ljust(FRAME_BYTES, b"\0"))
+                stats["sent"] += 1
+                await asyncio.sleep(FRAME_INTERVAL)
+            # Leave time for the last transcripts before closing
+            await asyncio.sleep(1)
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+        stats["completed"] += 1
+    except Exception as e:
+        stats["failed"] += 1
+        print(f"{prefix} failed: {type(e).__name__}: {e}")
+
+
+async def run_load(url: str, clients: int, duration: float, ramp_up: float) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"sent": 0, "received": 0, "finals": 0, "misrouted": 0, "completed": 0, "failed": 0, "latencies": []}
+    tasks = []
+    for client_id in range(clients):
+        tasks.append(asyncio.create_task(run_client(url, client_id, duration, stats)))
+        await asyncio.sleep(ramp_up / clients)
+    await asyncio.gather(*tasks)
+
+    latencies = sorted(stats.pop("latencies"))
+    if latencies:
+        stats["latency_p50_ms"] = round(statistics.median(latencies) * 1000, 1)
+        stats["latency_p95_ms"] = round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1)
+        stats["latency_max_ms"] = round(latencies[-1] * 1000, 1)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of the /ws/audio websocket against a stub Deepgram server.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stub = commands.add_parser("stub", help="run the stub Deepgram server")
+    stub.add_argument("--host", default="localhost")
+    stub.add_argument("--port", type=int, default=8765)
+    stub.add_argument("--final-every", type=int, default=5, help="mark every Nth transcript as final")
+
+    run = commands.add_parser("run", help="open concurrent client sockets on the app")
+    run.add_argument("--url", default="ws://localhost:8000/ws/audio")
+    run.add_argument("--clients", type=int, default=300)
+    run.add_argument("--duration", type=float, default=20, help="seconds of audio sent by each client")
+    run.add_argument("--ramp-up", type=float, default=5, help="seconds over which the clients connect")
+    args = parser.parse_args()
+
+    if args.command == "stub":
+        asyncio.run(run_stub(args.host, args.port, args.final_every))
+        return
+
+    stats = asyncio.run(run_load(args.url, args.clients, args.duration, args.ramp_up))
+    print(json.dumps(stats, indent=2))
+    if stats["misrouted"] or stats["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()